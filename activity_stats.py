@@ -1,6 +1,176 @@
+from collections.abc import Mapping
 import numpy as np
+from users import USER_SIZES, SEGMENTS, SYBIL
+from random_streams import as_generator, draw_seed, stream_id
 
-def generate_stats(user):
+# Size code for regular users whose user_size is not one of USER_SIZES.
+UNKNOWN_SIZE = len(SEGMENTS)
+
+# Per-size parameters, indexed by size code: small, medium, large, sybil, unknown.
+# Sybils (users without a user_size) only get a trading_volume of endowment * 100.
+VOLUME_MULTIPLIER = np.array([50, 150, 300, 100, 100])
+QSCORE_RANGE = np.array([(50, 150), (100, 200), (150, 300), (0, 0), (100, 200)])
+REFERRAL_RANGE = np.array([(0, 50), (0, 100), (0, 150), (0, 0), (0, 100)])
+
+STAT_FIELDS = ('trading_volume', 'maker_volume', 'taker_volume', 'qscore', 'referral_points',
+               'swap_volume', 'pre_volume', 'farm_volume', 'boost_mult', 'deposit_bonus',
+               'early_bonus', 'volume', 'engagement', 'referrals', 'deposits')
+
+# Stats that are a deterministic function of user_size and endowment.
+DETERMINISTIC_STATS = ('trading_volume', 'volume')
+
+# Values used for sybil rows of batched stats: the defaults the pre-TGE policies
+# fall back to when a key is missing from a user's stats.
+MISSING_STAT_DEFAULTS = {'boost_mult': 1.0}
+
+def size_code(user):
+    """
+    Size code of a user object: its USER_SIZES index, SYBIL if it has no
+    user_size, or UNKNOWN_SIZE for any other user_size.
+    """
+    if not hasattr(user, 'user_size'):
+        return SYBIL
+    if user.user_size in USER_SIZES:
+        return USER_SIZES.index(user.user_size)
+    return UNKNOWN_SIZE
+
+class ActivityStats(Mapping):
+    """
+    Lazy columnar activity stats for a batch of users.
+
+    A read-only mapping from each key of STAT_FIELDS to an array with one entry per
+    user. Columns are generated on first access and cached, so a policy that reads
+    two keys only pays for those two. Each field draws from its own random stream,
+    seeded from (seed, field name), so the values of a field do not depend on which
+    other fields are requested or on fields added later.
+
+    Parameters:
+      - user_size: array of size codes (see size_code).
+      - endowment: array of endowments.
+      - seed: base seed; drawn via random_streams.as_generator() (i.e. from the global
+              NumPy RNG) if omitted.
+
+    Rows of sybil users (no user_size) only carry a meaningful 'trading_volume';
+    their other columns hold the policies' missing-key defaults (0, or 1.0 for 'boost_mult').
+    """
+    def __init__(self, user_size, endowment, seed=None):
+        self.user_size = np.asarray(user_size)
+        self.endowment = np.asarray(endowment, dtype=float)
+        self.seed = seed if seed is not None else draw_seed(as_generator())
+        self.regular = self.user_size != SYBIL
+        self.num_regular = int(self.regular.sum())
+        self._columns = {}
+
+    def __getitem__(self, key):
+        if key not in self._columns:
+            if key not in STAT_FIELDS:
+                raise KeyError(key)
+            self._columns[key] = getattr(self, '_' + key)()
+        return self._columns[key]
+
+    def __iter__(self):
+        return iter(STAT_FIELDS)
+
+    def __len__(self):
+        return len(STAT_FIELDS)
+
+    def rng(self, key):
+        return np.random.default_rng([self.seed, stream_id(key)])
+
+    def _regular(self, column):
+        return column if self.num_regular == len(column) else column[self.regular]
+
+    def _expand(self, key, values):
+        # Place values drawn for regular users into a full column.
+        if self.num_regular == len(self.user_size):
+            return values
+        column = np.full(len(self.user_size), MISSING_STAT_DEFAULTS.get(key, 0.0))
+        column[self.regular] = values
+        return column
+
+    def _uniform_volume(self, key, low, high):
+        volume = self._regular(self['trading_volume'])
+        return self._expand(key, volume * self.rng(key).uniform(low, high, self.num_regular))
+
+    def _trading_volume(self):
+        return self.endowment * VOLUME_MULTIPLIER[self.user_size]
+
+    def _maker_volume(self):
+        return self._uniform_volume('maker_volume', 0.3, 0.7)
+
+    def _taker_volume(self):
+        return self._expand('taker_volume', self._regular(self['trading_volume'] - self['maker_volume']))
+
+    def _qscore(self):
+        sizes = self._regular(self.user_size)
+        return self._expand('qscore', self.rng('qscore').uniform(QSCORE_RANGE[sizes, 0], QSCORE_RANGE[sizes, 1]))
+
+    def _referral_points(self):
+        sizes = self._regular(self.user_size)
+        return self._expand('referral_points', self.rng('referral_points').uniform(REFERRAL_RANGE[sizes, 0],
+                                                                                   REFERRAL_RANGE[sizes, 1]))
+
+    def _swap_volume(self):
+        return self._uniform_volume('swap_volume', 0.8, 1.2)
+
+    def _pre_volume(self):
+        return self._uniform_volume('pre_volume', 0.5, 0.8)
+
+    def _farm_volume(self):
+        return self._uniform_volume('farm_volume', 0.2, 0.5)
+
+    def _boost_mult(self):
+        return self._expand('boost_mult', self.rng('boost_mult').choice([1.0, 2.0, 3.0, 4.0], self.num_regular))
+
+    def _deposit_bonus(self):
+        return self._expand('deposit_bonus', self.rng('deposit_bonus').choice([0, 50, 100], self.num_regular))
+
+    def _early_bonus(self):
+        return self._expand('early_bonus', self.rng('early_bonus').choice([0, 25, 50], self.num_regular))
+
+    def _volume(self):
+        return self._expand('volume', self._regular(self['trading_volume']))
+
+    def _engagement(self):
+        return self._expand('engagement', self.rng('engagement').uniform(1, 10, self.num_regular))
+
+    def _referrals(self):
+        return self._expand('referrals', self.rng('referrals').integers(0, 5, self.num_regular))
+
+    def _deposits(self):
+        return self._expand('deposits', self.rng('deposits').uniform(100, 1000, self.num_regular))
+
+def generate_stats_batch(user_size, endowment, fields=None, seed=None):
+    """
+    Columnar generate_stats: activity statistics for many users at once.
+
+    Returns a dict with one array per requested field (all of STAT_FIELDS by default),
+    each drawn with a single NumPy call using per-size parameter lookups.
+    See ActivityStats for the parameters and the handling of sybil rows.
+    """
+    stats = ActivityStats(user_size, endowment, seed=seed)
+    return {key: stats[key] for key in (fields if fields is not None else STAT_FIELDS)}
+
+def required_fields(preTGE_rewards_policy):
+    """
+    The STAT_FIELDS a pre-TGE rewards policy reads, from its `required_stats`
+    (all fields if it does not declare them).
+    """
+    required = getattr(preTGE_rewards_policy, 'required_stats', None)
+    if required is None:
+        return STAT_FIELDS
+    return tuple(key for key in required if key in STAT_FIELDS)
+
+def stats_row(stats, index, user_size_code, fields=None):
+    """
+    Per-user dict view of row `index` of columnar stats, shaped like generate_stats(user):
+    sybil rows only contain 'trading_volume'. `fields` limits the keys (default: all).
+    """
+    if user_size_code == SYBIL:
+        return {'trading_volume': stats['trading_volume'][index]}
+    return {key: stats[key][index] for key in (fields if fields is not None else STAT_FIELDS)}
+
+def generate_stats(user, rng=None):
     """
     Generate activity statistics for a user based on their attributes.
     
@@ -23,67 +193,13 @@ def generate_stats(user):
       - 'deposits': a value representing deposit amount.
       
     For users without a defined 'user_size', only a simplified 'trading_volume' is returned.
+
+    This is a one-row view over ActivityStats, seeded from `rng` (a Generator or seed),
+    by default from the user's own `rng`, so seeded users give reproducible stats.
     
     Source: Adapted from assumptions based on Vertex and dYdX pre-TGE incentive designs.
     """
-    if hasattr(user, 'user_size'):
-        # Set parameters based on user size.
-        if user.user_size == 'small':
-            volume_multiplier = 50
-            qscore_range = (50, 150)
-            referral_range = (0, 50)
-        elif user.user_size == 'medium':
-            volume_multiplier = 150
-            qscore_range = (100, 200)
-            referral_range = (0, 100)
-        elif user.user_size == 'large':
-            volume_multiplier = 300
-            qscore_range = (150, 300)
-            referral_range = (0, 150)
-        else:
-            volume_multiplier = 100
-            qscore_range = (100, 200)
-            referral_range = (0, 100)
-        
-        # Basic stats.
-        trading_volume = user.endowment * volume_multiplier
-        maker_volume = trading_volume * np.random.uniform(0.3, 0.7)
-        taker_volume = trading_volume - maker_volume
-        
-        # Additional keys for various policies.
-        # For Jupiter Volume Tier Reward Policy.
-        swap_volume = trading_volume * np.random.uniform(0.8, 1.2)
-        
-        # For Aevo Farm Boost Reward Policy.
-        pre_volume = trading_volume * np.random.uniform(0.5, 0.8)
-        farm_volume = trading_volume * np.random.uniform(0.2, 0.5)
-        boost_mult = np.random.choice([1.0, 2.0, 3.0, 4.0])
-        deposit_bonus = np.random.choice([0, 50, 100])
-        early_bonus = np.random.choice([0, 25, 50])
-        
-        # For Generic Pre-TGE Reward Policy.
-        volume_generic = trading_volume  # can be the same as trading_volume
-        engagement = np.random.uniform(1, 10)
-        referrals = np.random.randint(0, 5)
-        deposits = np.random.uniform(100, 1000)
-        
-        stats = {
-            'trading_volume': trading_volume,
-            'maker_volume': maker_volume,
-            'taker_volume': taker_volume,
-            'qscore': np.random.uniform(*qscore_range),
-            'referral_points': np.random.uniform(*referral_range),
-            'swap_volume': swap_volume,
-            'pre_volume': pre_volume,
-            'farm_volume': farm_volume,
-            'boost_mult': boost_mult,
-            'deposit_bonus': deposit_bonus,
-            'early_bonus': early_bonus,
-            'volume': volume_generic,
-            'engagement': engagement,
-            'referrals': referrals,
-            'deposits': deposits
-        }
-    else:
-        stats = {'trading_volume': user.endowment * 100}
-    return stats
+    code = size_code(user)
+    rng = as_generator(rng if rng is not None else user.rng)
+    stats = ActivityStats([code], [user.endowment], seed=draw_seed(rng))
+    return stats_row(stats, 0, code)
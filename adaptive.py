@@ -0,0 +1,182 @@
+from statistics import NormalDist
+import numpy as np
+from random_streams import RandomStreams
+from pipeline import run_staged
+from shared_population import SharedPopulation
+from user_pool import DEFAULT_SYBIL_FRACTION
+
+def _paths(results, key, paths_key):
+    # Replicate paths when the run has them, else its single path as one row.
+    return np.atleast_2d(results[paths_key] if paths_key in results else results[key])
+
+# Scalar metrics of one MonteCarloSimulation.run() result, averaged over its replicates.
+METRICS = {
+    'final_price': lambda r: _paths(r, 'dynamic_prices', 'price_paths')[:, -1].mean(),
+    'mean_price': lambda r: _paths(r, 'dynamic_prices', 'price_paths').mean(),
+    'final_active_fraction': lambda r: _paths(r, 'active_fraction_history', 'active_fraction_paths')[:, -1].mean(),
+}
+
+def t_quantile(p, dof):
+    """
+    Quantile `p` of Student's t distribution with `dof` degrees of freedom, from the
+    Cornish-Fisher expansion around the normal quantile (within about 3% for dof >= 2,
+    0.1% for dof >= 5). Avoids a scipy dependency.
+    """
+    z = NormalDist().inv_cdf(p)
+    return (z + (z**3 + z) / (4 * dof) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * dof**3))
+
+def confidence_interval(samples, confidence=0.95):
+    """
+    (mean, half_width) of the Student t confidence interval for the mean of `samples`.
+    """
+    samples = np.asarray(samples, dtype=float)
+    n = len(samples)
+    if n < 2:
+        return samples.mean() if n else np.nan, np.inf
+    half_width = t_quantile(0.5 + confidence / 2, n - 1) * samples.std(ddof=1) / np.sqrt(n)
+    return samples.mean(), half_width
+
+def _converged(samples, rel_width, confidence):
+    intervals = [confidence_interval(values, confidence) for values in samples.values()]
+    return all(2 * half_width <= rel_width * abs(mean) for mean, half_width in intervals)
+
+def _summary(samples, results, converged, confidence):
+    intervals = {name: confidence_interval(values, confidence) for name, values in samples.items()}
+    return {
+        "runs": len(results),
+        "converged": converged,
+        "estimates": {name: interval[0] for name, interval in intervals.items()},
+        "half_widths": {name: interval[1] for name, interval in intervals.items()},
+        "samples": {name: np.array(values) for name, values in samples.items()},
+        "results": results,
+    }
+
+def _run_rng(root, k, common_random_numbers):
+    # Child k of SeedSequence `root`, wrapped in RandomStreams for common random numbers.
+    child = np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (k,))
+    return RandomStreams(child) if common_random_numbers else child
+
+def shared_populations(num_users, seed=None, runs=4, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None):
+    """
+    One SharedPopulation for each of the first `runs` runs of run_adaptive/
+    run_staged_adaptive with the same `seed` and common_random_numbers: entry k holds
+    the base population run k would draw, so a parent process can publish them once for
+    all of its workers. Every combo makes at least min_runs runs, so runs=min_runs
+    shares the populations that are certain to be used without holding max_runs of them.
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    populations = []
+    try:
+        for k in range(runs):
+            populations.append(SharedPopulation.generate(num_users, sybil_fraction, size_mix,
+                                                         _run_rng(root, k, True).population))
+    except BaseException:
+        for population in populations:
+            population.close()
+            population.unlink()
+        raise
+    return populations
+
+def _check_populations(populations, common_random_numbers):
+    if populations is not None and not common_random_numbers:
+        # Without separate streams the population draws would shift every later draw.
+        raise ValueError("populations require common_random_numbers=True.")
+
+def _population(populations, k):
+    # Shared population of run k, or None for runs beyond the shared ones.
+    return populations[k] if populations is not None and k < len(populations) else None
+
+def run_adaptive(make_simulation, metrics=tuple(METRICS), rel_width=0.05, confidence=0.95,
+                 min_runs=4, max_runs=50, seed=None, common_random_numbers=False, populations=None):
+    """
+    Repeat MonteCarloSimulation runs until the confidence interval of every metric
+    is narrow enough, so that noisy scenarios get more runs than quiet ones.
+
+    make_simulation(rng) must return a fresh MonteCarloSimulation seeded with `rng`.
+    Each run draws its own population and paths and contributes one sample per metric
+    (its mean over replicates, so replicate schemes like antithetic pairs are handled).
+    Runs stop once the full width of the `confidence` interval of each of `metrics`
+    (names in METRICS) is at most `rel_width` times the absolute mean, after at least
+    `min_runs` and at most `max_runs` runs.
+
+    Run k is seeded by child k of the SeedSequence `seed`. With common_random_numbers
+    the child is wrapped in RandomStreams, so run k of every combo driven with the same
+    seed shares its random numbers (see random_streams.RandomStreams).
+    `populations` (see shared_populations) then optionally supplies the base population
+    of the first runs: run k < len(populations) calls
+    make_simulation(rng, population=populations[k]); later runs draw their own, which
+    gives the same population.
+
+    Returns a dict with:
+      - runs: number of runs,
+      - converged: whether the width target was met within max_runs,
+      - estimates, half_widths: {metric: value} of the final intervals,
+      - samples: {metric: array with one sample per run},
+      - results: list of the run() results,
+      - simulation: the last simulation, e.g. to inspect its user pool.
+    """
+    _check_populations(populations, common_random_numbers)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    samples = {name: [] for name in metrics}
+    results = []
+    converged = False
+    simulation = None
+    while len(results) < max_runs:
+        rng = _run_rng(root, len(results), common_random_numbers)
+        population = _population(populations, len(results))
+        if population is None:
+            simulation = make_simulation(rng)
+        else:
+            simulation = make_simulation(rng, population=population)
+        run_results = simulation.run()
+        results.append(run_results)
+        for name in metrics:
+            samples[name].append(METRICS[name](run_results))
+        if len(results) >= min_runs and _converged(samples, rel_width, confidence):
+            converged = True
+            break
+    summary = _summary(samples, results, converged, confidence)
+    summary["simulation"] = simulation
+    return summary
+
+def run_staged_adaptive(make_simulation, preTGE_policies, airdrop_policies, postTGE_variants,
+                        metrics=tuple(METRICS), rel_width=0.05, confidence=0.95, min_runs=4, max_runs=50,
+                        seed=None, common_random_numbers=False, populations=None):
+    """
+    run_adaptive for a grid of combinations run as stages by pipeline.run_staged.
+
+    Every round runs the stage tree once more (seeded like run_adaptive's runs), but only
+    for the combinations whose intervals are still too wide, so rounds get cheaper as
+    combinations converge and the remaining runs go to the noisy ones. `populations`
+    works as in run_adaptive.
+
+    Returns (summaries, TGE_tokens): a run_adaptive-style summary (without "simulation")
+    per (pre, airdrop, variant) name triple, and the TGE tokens of the first round per
+    (pre, airdrop) pair.
+    """
+    _check_populations(populations, common_random_numbers)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    combos = [(pre, ad, variant) for pre, _ in preTGE_policies for ad, _ in airdrop_policies
+              for variant, _ in postTGE_variants]
+    samples = {combo: {name: [] for name in metrics} for combo in combos}
+    results = {combo: [] for combo in combos}
+    pending = set(combos)
+    TGE_tokens = None
+    for k in range(max_runs):
+        if not pending:
+            break
+        round_results, round_tokens = run_staged(make_simulation, preTGE_policies, airdrop_policies,
+                                                 postTGE_variants, _run_rng(root, k, common_random_numbers),
+                                                 combos=pending,
+                                                 population=_population(populations, k))
+        TGE_tokens = TGE_tokens if TGE_tokens is not None else round_tokens
+        for combo, run_results in round_results.items():
+            results[combo].append(run_results)
+            for name in metrics:
+                samples[combo][name].append(METRICS[name](run_results))
+            if len(results[combo]) >= min_runs and _converged(samples[combo], rel_width, confidence):
+                pending.discard(combo)
+    summaries = {combo: _summary(samples[combo], results[combo], combo not in pending, confidence)
+                 for combo in combos}
+    return summaries, TGE_tokens
@@ -3,11 +3,29 @@ import numpy as np
 class AirdropPolicy:
     """
     Default policy that assigns a token reward equal to the normalized airdrop_points.
+
+    calculate_tokens_batch(airdrop_points, users) is the array version used by the
+    columnar pools. Subclasses that only implement calculate_tokens fall back to
+    one call per user.
     """
     def calculate_tokens(self, airdrop_points, user):
         # Returns a normalized token reward in [0,1].
         return airdrop_points
 
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        """
+        Tokens for an array of normalized airdrop_points. `users` is an optional
+        sequence of the matching user objects. Returns a float array.
+        """
+        airdrop_points = np.asarray(airdrop_points, dtype=float)
+        if type(self).calculate_tokens is AirdropPolicy.calculate_tokens:
+            return airdrop_points.copy()
+        return np.array([self.calculate_tokens(p, users[i] if users is not None else None)
+                         for i, p in enumerate(airdrop_points)], dtype=float)
+
+def _tier_index(thresholds, airdrop_points, side):
+    return np.searchsorted(thresholds, np.asarray(airdrop_points, dtype=float), side=side)
+
 class LinearAirdropPolicy(AirdropPolicy):
     """
     Linear policy: tokens = factor * airdrop_points.
@@ -19,6 +37,9 @@ class LinearAirdropPolicy(AirdropPolicy):
     def calculate_tokens(self, airdrop_points, user):
         return self.factor * airdrop_points
 
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        return self.factor * np.asarray(airdrop_points, dtype=float)
+
 class ExponentialAirdropPolicy(AirdropPolicy):
     """
     Exponential policy: tokens = factor * (exp(airdrop_points / scaling) - 1).
@@ -36,6 +57,10 @@ class ExponentialAirdropPolicy(AirdropPolicy):
         points = min(airdrop_points, 1.0)
         return self.factor * (np.exp(points / self.scaling) - 1)
 
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        points = np.minimum(np.asarray(airdrop_points, dtype=float), 1.0)
+        return self.factor * (np.exp(points / self.scaling) - 1)
+
 class TieredConstantAirdropPolicy(AirdropPolicy):
     """
     Tiered Constant policy on a normalized scale.
@@ -50,6 +75,8 @@ class TieredConstantAirdropPolicy(AirdropPolicy):
             self.tiers = [(0.2, 0.1), (0.6, 0.4), (np.inf, 1.0)]
         else:
             self.tiers = tiers
+        self._thresholds = np.array([threshold for threshold, _ in self.tiers], dtype=float)
+        self._amounts = np.array([token_amt for _, token_amt in self.tiers], dtype=float)
 
     def calculate_tokens(self, airdrop_points, user):
         for threshold, token_amt in self.tiers:
@@ -57,6 +84,11 @@ class TieredConstantAirdropPolicy(AirdropPolicy):
                 return token_amt
         return self.tiers[-1][1]
 
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        # First threshold above the points; past the end means the last tier.
+        tier = _tier_index(self._thresholds, airdrop_points, 'right')
+        return self._amounts[np.minimum(tier, len(self._amounts) - 1)]
+
 class TieredLinearAirdropPolicy(AirdropPolicy):
     """
     Tiered Linear policy on a normalized scale.
@@ -72,6 +104,14 @@ class TieredLinearAirdropPolicy(AirdropPolicy):
             self.tiers = [(0.2, 1.0), (0.6, 1.5), (np.inf, 2.0)]
         else:
             self.tiers = tiers
+        # Tier k covers (starts[k], thresholds[k]] and adds offsets[k], the tokens of all
+        # full tiers below it. A trailing zero-factor tier covers points above a finite
+        # last threshold.
+        self._thresholds = np.array([threshold for threshold, _ in self.tiers], dtype=float)
+        self._starts = np.concatenate(([0.0], self._thresholds))
+        self._factors = np.append(np.array([factor for _, factor in self.tiers], dtype=float), 0.0)
+        full_tiers = (self._thresholds - self._starts[:-1]) * self._factors[:-1]
+        self._offsets = np.concatenate(([0.0], np.cumsum(full_tiers)))
 
     def calculate_tokens(self, airdrop_points, user):
         tokens = 0.0
@@ -85,6 +125,11 @@ class TieredLinearAirdropPolicy(AirdropPolicy):
                 prev_threshold = threshold
         return tokens
 
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        points = np.asarray(airdrop_points, dtype=float)
+        tier = _tier_index(self._thresholds, points, 'left')
+        return self._offsets[tier] + (points - self._starts[tier]) * self._factors[tier]
+
 class TieredExponentialAirdropPolicy(AirdropPolicy):
     """
     Tiered Exponential policy on a normalized scale.
@@ -104,6 +149,13 @@ class TieredExponentialAirdropPolicy(AirdropPolicy):
             ]
         else:
             self.tiers = tiers
+        # Same layout as TieredLinearAirdropPolicy, with a per-tier scaling.
+        self._thresholds = np.array([threshold for threshold, _ in self.tiers], dtype=float)
+        self._starts = np.concatenate(([0.0], self._thresholds))
+        self._factors = np.append(np.array([params.get('factor', 1.0) for _, params in self.tiers], dtype=float), 0.0)
+        self._scalings = np.append(np.array([params.get('scaling', 0.2) for _, params in self.tiers], dtype=float), 1.0)
+        full_tiers = self._factors[:-1] * (np.exp((self._thresholds - self._starts[:-1]) / self._scalings[:-1]) - 1)
+        self._offsets = np.concatenate(([0.0], np.cumsum(full_tiers)))
 
     def calculate_tokens(self, airdrop_points, user):
         tokens = 0.0
@@ -118,3 +170,8 @@ class TieredExponentialAirdropPolicy(AirdropPolicy):
                 tokens += factor * (np.exp((threshold - prev_threshold) / scaling) - 1)
                 prev_threshold = threshold
         return tokens
+
+    def calculate_tokens_batch(self, airdrop_points, users=None):
+        points = np.asarray(airdrop_points, dtype=float)
+        tier = _tier_index(self._thresholds, points, 'left')
+        return self._offsets[tier] + self._factors[tier] * (np.exp((points - self._starts[tier]) / self._scalings[tier]) - 1)
@@ -0,0 +1,136 @@
+import glob
+import json
+import os
+import struct
+import tempfile
+import zipfile
+from collections.abc import Mapping
+import numpy as np
+from random_streams import STREAMS
+
+# Checkpoint files sort by stage, then by post-TGE step.
+PREFIX = 'checkpoint-'
+STAGE_ORDER = {'preTGE': 0, 'TGE': 1, 'postTGE': 2}
+
+def checkpoint_name(stage, step=None):
+    """
+    File name of a checkpoint, e.g. checkpoint-1-TGE.npz or checkpoint-2-postTGE-000024.npz.
+    """
+    suffix = f"-{step:06d}" if step is not None else ''
+    return f"{PREFIX}{STAGE_ORDER[stage]}-{stage}{suffix}.npz"
+
+def json_default(value):
+    # NumPy scalars in the state (token totals, aggregates) are stored as Python numbers.
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def write_checkpoint(path, arrays, state):
+    """
+    Atomically write `arrays` (name -> array, including memory maps, which are streamed)
+    and the JSON-serializable `state` (NumPy scalars allowed) to the uncompressed .npz file `path`.
+
+    The data goes to a temporary file in the same directory, which is fsynced and then
+    renamed over `path`, so a crash leaves the previous file or the new one, never a
+    partial checkpoint.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, __state__=np.array(json.dumps(state, default=json_default)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+class CheckpointArrays(Mapping):
+    """
+    Read-only mapping over the arrays of a checkpoint file, each a memory map into the
+    (uncompressed) .npz, so a large column can be restored chunk by chunk without
+    loading it whole.
+    """
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            self._members = {info.filename[:-len('.npy')]: info for info in archive.infolist()}
+
+    def __getitem__(self, name):
+        if name not in self._members:
+            raise KeyError(name)
+        info = self._members[name]
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{name} is compressed and cannot be memory-mapped.")
+        with open(self.path, 'rb') as f:
+            # The data follows the local file header, its name and its extra field.
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+        if dtype.hasobject:
+            raise ValueError(f"{name} holds Python objects.")
+        if shape == () or 0 in shape:
+            with zipfile.ZipFile(self.path) as archive, archive.open(info) as member:
+                return np.lib.format.read_array(member)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                         order='F' if fortran_order else 'C')
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def close(self):
+        # Memory maps are released with the arrays themselves.
+        pass
+
+def read_checkpoint(path):
+    """
+    (arrays, state) of a checkpoint written by write_checkpoint. `arrays` is a
+    CheckpointArrays of memory maps; close it when done.
+    """
+    arrays = CheckpointArrays(path)
+    return arrays, json.loads(str(arrays['__state__']))
+
+def latest_checkpoint(directory):
+    """
+    Path of the most advanced checkpoint in `directory`, or None.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, PREFIX + '*.npz')))
+    return paths[-1] if paths else None
+
+def prune_checkpoints(directory, keep):
+    """
+    Remove the checkpoints that `keep` (a path) supersedes: older post-TGE checkpoints
+    and any later-stage leftovers of a previous run. Earlier stages are kept.
+    """
+    keep_name = os.path.basename(keep)
+    postTGE_prefix = PREFIX + f"{STAGE_ORDER['postTGE']}-"
+    for path in glob.glob(os.path.join(directory, PREFIX + '*.npz')):
+        name = os.path.basename(path)
+        if name != keep_name and (name > keep_name or name.startswith(postTGE_prefix)):
+            os.unlink(path)
+
+def generator_states(streams):
+    """
+    Bit generator states of a RandomStreams, by stream name (JSON-serializable).
+    """
+    return {name: getattr(streams, name).bit_generator.state for name in STREAMS}
+
+def restore_generator_states(streams, states):
+    for name in STREAMS:
+        getattr(streams, name).bit_generator.state = states[name]
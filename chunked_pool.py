@@ -0,0 +1,119 @@
+import copy
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+from user_pool import (ColumnarUserPool, ColumnChunk, UserViews, generate_population, segment_counts,
+                       DEFAULT_SYBIL_FRACTION)
+from users import SYBIL
+
+# Rough multiple of a chunk's own column bytes used by temporaries inside a phase
+# (retention probabilities, effective weights, index arrays, ...).
+CHUNK_WORKSPACE_FACTOR = 4
+
+class ChunkedUserPool(ColumnarUserPool):
+    """
+    Out-of-core ColumnarUserPool for populations larger than RAM.
+
+    Each column is a flat binary file under `storage_dir` (a temporary directory by
+    default). Pool-wide operations stream over chunks of `chunk_size` users that are
+    memory-mapped one at a time and unmapped right after, so peak RSS is set by
+    `memory_budget` (bytes) rather than by the number of users. Cross-user reductions
+    (max, sums, segment totals) are accumulated chunk by chunk.
+
+    The population is generated chunk by chunk. Segment counts are fixed for the whole
+    population (as in an in-memory pool) and dealt out to the chunks by multivariate
+    hypergeometric draws, so the segment mix does not depend on memory_budget. `users` views and cohorts() map whole
+    columns and are meant for inspection, not for streaming workloads.
+    """
+    DTYPES = {
+        'user_id': np.int64, 'wealth': np.float64, 'user_size': np.int8,
+        'interaction_rate': np.float64, 'endowment': np.float64, 'decay_rate': np.float64,
+        'airdrop_points': np.float64, 'tokens': np.float64, 'active': np.bool_,
+        'active_days': np.float64, 'is_sybil': np.bool_
+    }
+
+    def __init__(self, num_users, airdrop_policy=None, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None,
+                 memory_budget=256 * 2**20, storage_dir=None, rng=None):
+        bytes_per_user = sum(np.dtype(self.DTYPES[name]).itemsize for name in self.COLUMNS)
+        self.chunk_size = max(1, int(memory_budget // (bytes_per_user * CHUNK_WORKSPACE_FACTOR)))
+        self._owns_storage = storage_dir is None
+        self.storage_dir = storage_dir if storage_dir is not None else tempfile.mkdtemp(prefix='userpool_')
+        os.makedirs(self.storage_dir, exist_ok=True)
+        if self._owns_storage:
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self.storage_dir, True)
+        super().__init__(num_users, airdrop_policy=airdrop_policy, sybil_fraction=sybil_fraction, size_mix=size_mix,
+                         rng=rng)
+
+    def _path(self, name):
+        return os.path.join(self.storage_dir, f"{name}.dat")
+
+    def _map(self, name, start, stop, mode='r+'):
+        dtype = np.dtype(self.DTYPES[name])
+        return np.memmap(self._path(name), dtype=dtype, mode=mode,
+                         offset=start * dtype.itemsize, shape=(stop - start,))
+
+    def generate_users(self):
+        for name in self.COLUMNS:
+            with open(self._path(name), 'wb') as f:
+                f.truncate(self.num_users * np.dtype(self.DTYPES[name]).itemsize)
+        remaining = np.array(segment_counts(self.num_users, self.sybil_fraction, self.size_mix))
+        for chunk in self._chunks():
+            counts = self.streams.population.multivariate_hypergeometric(remaining, len(chunk))
+            remaining -= counts
+            population = generate_population(len(chunk), self.sybil_fraction, self.size_mix, self.streams.population,
+                                             counts=counts)
+            population['user_id'] += chunk.start
+            for name, column in population.items():
+                getattr(chunk, name)[:] = column
+            chunk.decay_rate[:] = 0.1
+            chunk.airdrop_points[:] = 0.0
+            chunk.tokens[:] = 0.0
+            chunk.active[:] = True
+            chunk.active_days[:] = 0
+            chunk.is_sybil[:] = chunk.user_size == SYBIL
+        self.users = UserViews(self)
+
+    def _chunks(self):
+        for start in range(0, self.num_users, self.chunk_size):
+            stop = min(start + self.chunk_size, self.num_users)
+            columns = {name: self._map(name, start, stop) for name in self.COLUMNS}
+            yield ColumnChunk(start, stop, columns)
+            for column in columns.values():
+                column.flush()
+            del columns
+
+    def _regular_index(self, chunk):
+        # Not cached: an index per regular user would grow with the population.
+        return np.flatnonzero(~chunk.is_sybil)
+
+    def copy(self):
+        """
+        Copy of the pool backed by copies of its column files in a new temporary directory.
+        """
+        clone = copy.copy(self)
+        clone.__dict__.update(copy.deepcopy({key: value for key, value in self.__dict__.items()
+                                             if key not in ('storage_dir', '_cleanup', 'users')}))
+        clone.storage_dir = tempfile.mkdtemp(prefix='userpool_')
+        clone._owns_storage = True
+        clone._cleanup = weakref.finalize(clone, shutil.rmtree, clone.storage_dir, True)
+        for name in self.COLUMNS:
+            shutil.copyfile(self._path(name), clone._path(name))
+        clone.users = UserViews(clone)
+        return clone
+
+    def __getattr__(self, name):
+        # Whole-column maps for views and inspection; only reached for column names
+        # since regular attributes are found before __getattr__ is consulted.
+        if name in ChunkedUserPool.DTYPES and 'storage_dir' in self.__dict__:
+            return self._map(name, 0, self.num_users)
+        raise AttributeError(name)
+
+    def close(self):
+        """
+        Delete the backing files if the pool created its own storage directory
+        (also done automatically when the pool is garbage collected).
+        """
+        if self._owns_storage:
+            self._cleanup()
@@ -1,3 +1,4 @@
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import concurrent.futures
@@ -29,13 +30,27 @@ from plot_helper import (
     plot_avg_price_evolution_overlay
 )
 from simulation import MonteCarloSimulation
-from users import RegularUser, SybilUser
+from users import SybilUser
 from activity_stats import generate_stats
+from adaptive import run_staged_adaptive, shared_populations
+from results_store import ResultsStore
 
-def run_simulation_for_combo(combo_name, num_users, total_supply, preTGE_steps, simulation_horizon,
-                             ad_policy, pre_policy, post_policy, post_policy_config,
-                             base_price, elasticity, buyback_rate, alpha=0.5,
-                             airdrop_allocation_fraction=0.25):
+def run_simulations_for_preTGE_policy(pre_name, pre_policy, airdrop_policies, postTGE_variants,
+                                      num_users, total_supply, preTGE_steps, simulation_horizon,
+                                      base_price, elasticity, buyback_rate, alpha=0.5,
+                                      airdrop_allocation_fraction=0.25, seed=None, common_random_numbers=False,
+                                      rel_width=0.05, min_runs=4, max_runs=30, results_dir="results",
+                                      populations=None):
+    """
+    Run every (airdrop policy, post-TGE variant) combo for one pre-TGE policy as a staged
+    pipeline: pre-TGE once, TGE once per airdrop policy, and a fork of that state per
+    post-TGE variant with its scenario parameters applied (see pipeline.run_staged).
+    The sweep below submits one task per (pre-TGE, airdrop) pair, so `airdrop_policies`
+    usually holds a single policy.
+    Each combo's results are written to the ResultsStore in `results_dir`; returns
+    {combo_name: ResultHandle}, so only the handles go back through the process pool.
+    `populations` are shared base populations of the first runs (see adaptive.shared_populations).
+    """
     # Define the demand series (raw demand values) as provided from Forgd.
     demand_values = np.array([
         45, 25, 10, 12, 6, 7, 1,
@@ -48,45 +63,52 @@ def run_simulation_for_combo(combo_name, num_users, total_supply, preTGE_steps,
         19, 21, 12, 10, 13
     ], dtype=float)
     
-    # Instantiate MonteCarloSimulation. All phases (pre-TGE, TGE, and dynamic post-TGE evolution)
-    # are now computed inside run().
-    sim = MonteCarloSimulation(
+    # Base MonteCarloSimulation; the staged pipeline swaps in the policies and scenario
+    # parameters of each stage.
+    make_simulation = lambda rng, population=None: MonteCarloSimulation(
         num_users=num_users,
         total_supply=total_supply,
         preTGE_steps=preTGE_steps,
         simulation_horizon=simulation_horizon,
-        airdrop_policy=ad_policy,
-        preTGE_rewards_policy=pre_policy,
-        postTGE_rewards_policy=post_policy,
         airdrop_allocation_fraction=airdrop_allocation_fraction,
         initial_price=base_price,
         buyback_rate=buyback_rate,
         elasticity=elasticity,
-        demand_series=demand_values
+        demand_series=demand_values,
+        columnar=True,
+        rng=rng,
+        population=population
     )
-    # Run the full simulation.
-    sim_results = sim.run()  # This returns a dictionary with dynamic price evolution.
+    # Repeat the stages until the final price, mean price and final active fraction of
+    # each combo are known to within rel_width (or max_runs is reached).
+    summaries, TGE_tokens = run_staged_adaptive(make_simulation, [(pre_name, pre_policy)], airdrop_policies,
+                                                postTGE_variants, rel_width=rel_width, min_runs=min_runs,
+                                                max_runs=max_runs,
+                                                seed=seed, common_random_numbers=common_random_numbers,
+                                                populations=populations)
     
-    # Apply a post-TGE reward policy (engagement multiplier) to each RegularUser.
-    post_reward_policy = GenericPostTGERewardPolicy()
-    active_days = sim_results["active_fraction_history"][-1] * simulation_horizon \
-                  if len(sim_results["active_fraction_history"]) > 0 else simulation_horizon
-    for user in sim.user_pool.users:
-        if isinstance(user, RegularUser):
-            post_reward_policy.apply_rewards(user, active_days)
-    
-    # IMPORTANT: change the key for prices to "prices" so that plot_helper works correctly.
-    return combo_name, {
-        "TGE_total": sim_results["scaled_TGE_total"],
-        "months": sim_results["months"],
-        "prices": sim_results["dynamic_prices"],  # rename to "prices"
-        "active_fraction_history": sim_results["active_fraction_history"],
-        "TGE_tokens": [user.tokens for user in sim.user_pool.users],
-        "unlocked_history": sim_results["unlocked_history"],
-        "total_unlocked_history": sim_results["total_unlocked_history"],
-        "distribution": sim_results["distribution"],
-        "combo_label": combo_name
-    }
+    store = ResultsStore(results_dir)
+    handles = {}
+    for (_, ad_name, variant_name), adaptive in summaries.items():
+        combo_name = f"{pre_name} + {ad_name} + {variant_name}"
+        print(f"{combo_name}: {adaptive['runs']} runs (converged: {adaptive['converged']})")
+        sim_results = adaptive["results"][-1]
+        # IMPORTANT: change the key for prices to "prices" so that plot_helper works correctly.
+        handles[combo_name] = store.write(combo_name, {
+            "TGE_total": sim_results["scaled_TGE_total"],
+            "months": sim_results["months"],
+            "prices": np.mean([r["dynamic_prices"] for r in adaptive["results"]], axis=0),  # rename to "prices"
+            "active_fraction_history": np.mean([r["active_fraction_history"] for r in adaptive["results"]], axis=0),
+            "runs": adaptive["runs"],
+            "estimates": adaptive["estimates"],
+            "half_widths": adaptive["half_widths"],
+            "TGE_tokens": TGE_tokens[(pre_name, ad_name)],
+            "unlocked_history": sim_results["unlocked_history"],
+            "total_unlocked_history": sim_results["total_unlocked_history"],
+            "distribution": sim_results["distribution"],
+            "combo_label": combo_name
+        })
+    return handles
 
 if __name__ == '__main__':
     # Define airdrop conversion policies.
@@ -131,36 +153,82 @@ if __name__ == '__main__':
     buyback_rate = 0.2
     alpha = 0.1
     elasticity = 0.5
+    seed = 2024
+    # Common random numbers: run k of every combo draws its population, activity stats,
+    # retention and price noise from the same named streams, so differences between heatmap
+    # cells come from the policies rather than from Monte Carlo noise. Otherwise every
+    # pre-TGE policy gets its own child of the seed's SeedSequence.
+    common_random_numbers = True
+    # Each combo is rerun until its metrics' confidence intervals are this narrow
+    # (relative full width), after at least min_runs and within a budget of max_runs runs.
+    rel_width = 0.05
+    min_runs = 4
+    max_runs = 30
+    # Per-combo results are stored here; `python main.py --plot-only` redraws the plots
+    # from a previous run's store without rerunning the simulations.
+    results_dir = "results"
+    plot_only = "--plot-only" in sys.argv
+    
+    # Post-TGE variants forked from each TGE state: reward policy x scenario. Scenario
+    # parameters (sigma, jumps, buyback_rate) override the simulation's.
+    postTGE_variants = [
+        (f"{reward_name} + {scenario_name}", {"postTGE_rewards_policy": reward_policy, **scenario_config})
+        for reward_name, reward_policy in postTGE_policies
+        for scenario_name, scenario_config in postTGE_scenarios
+    ]
     
-    results = {}
     tasks = []
+    # The tasks of one pre-TGE policy share its seed, so its airdrop policies are paired.
+    if common_random_numbers:
+        pre_seeds = [seed] * len(preTGE_policies)
+    else:
+        pre_seeds = np.random.SeedSequence(seed).spawn(len(preTGE_policies))
+    if not plot_only:
+        # Results of an earlier grid would otherwise show up in the plots.
+        ResultsStore(results_dir).clear()
+    # With common random numbers run k of every task draws the same population, so the
+    # parent draws the populations of the first min_runs runs, which every combo uses,
+    # once into shared memory and the workers attach to them instead of regenerating
+    # their own. Later runs draw their population in the worker.
+    populations = []
+    if common_random_numbers and not plot_only:
+        populations = shared_populations(num_users, seed=seed, runs=min_runs)
     
-    with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
-        for pre_name, pre_policy in preTGE_policies:
-            for ad_name, ad_policy in airdrop_policies:
-                for reward_name, reward_policy in postTGE_policies:
-                    for scenario_name, scenario_config in postTGE_scenarios:
-                        combo_name = f"{pre_name} + {ad_name} + {reward_name} + {scenario_name}"
-                        print(f"Submitting simulation for: {combo_name}")
-                        # Use the buyback_rate from config if provided.
-                        post_buyback_rate = scenario_config.get("buyback_rate", buyback_rate)
-                        task = executor.submit(
-                            run_simulation_for_combo,
-                            combo_name,
-                            num_users, total_supply, preTGE_steps, simulation_horizon,
-                            ad_policy, pre_policy, reward_policy, scenario_config,
-                            base_price, elasticity, post_buyback_rate,
-                            alpha=alpha,
-                            airdrop_allocation_fraction=airdrop_allocation_percentage
-                        )
-                        tasks.append(task)
-        
-        for future in concurrent.futures.as_completed(tasks):
-            combo_name, res = future.result()
-            results[combo_name] = res
-            print(f"Completed simulation for: {combo_name}")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
+            # One task per (pre-TGE, airdrop) pair keeps all workers busy; each task still
+            # forks its post-TGE variants from a shared TGE state.
+            for (pre_name, pre_policy), pre_seed in zip(preTGE_policies if not plot_only else [], pre_seeds):
+                for ad_name, ad_policy in airdrop_policies:
+                    print(f"Submitting simulations for: {pre_name} + {ad_name}")
+                    task = executor.submit(
+                        run_simulations_for_preTGE_policy,
+                        pre_name, pre_policy, [(ad_name, ad_policy)], postTGE_variants,
+                        num_users, total_supply, preTGE_steps, simulation_horizon,
+                        base_price, elasticity, buyback_rate,
+                        alpha=alpha,
+                        airdrop_allocation_fraction=airdrop_allocation_percentage,
+                        seed=pre_seed,
+                        common_random_numbers=common_random_numbers,
+                        rel_width=rel_width,
+                        min_runs=min_runs,
+                        max_runs=max_runs,
+                        results_dir=results_dir,
+                        populations=populations or None
+                    )
+                    tasks.append(task)
+            
+            for future in concurrent.futures.as_completed(tasks):
+                handles = future.result()
+                print(f"Completed {len(handles)} simulations.")
+    finally:
+        # Free the shared memory even if a task failed.
+        for population in populations:
+            population.close()
+            population.unlink()
     
-    # (Plotting code below remains the same.)
+    # The plots read the stored results, memory-mapped, one combo at a time.
+    results = ResultsStore(results_dir)
     
     # Plot Histogram of TGE Token Distribution
     baseline_results = {}
@@ -0,0 +1,56 @@
+import numpy as np
+from user_pool import ColumnarUserPool
+
+def _tokens(pool):
+    if isinstance(pool, ColumnarUserPool):
+        return np.array(pool.tokens)
+    return np.array([user.tokens for user in pool.users])
+
+def run_staged(make_simulation, preTGE_policies, airdrop_policies, postTGE_variants, rng=None, combos=None,
+               population=None):
+    """
+    Run every (pre-TGE policy, airdrop policy, post-TGE variant) combination as a tree
+    of stages on one population instead of one full simulation per combination:
+    pre-TGE runs once per pre-TGE policy, TGE once per (pre-TGE, airdrop) pair, and each
+    post-TGE variant is a MonteCarloSimulation.fork of its TGE state.
+
+    Parameters:
+      - make_simulation(rng): builds the base MonteCarloSimulation (and its population);
+                              its policies are replaced by the stages below.
+      - preTGE_policies, airdrop_policies: lists of (name, policy).
+      - postTGE_variants: list of (name, params), where params are simulation attributes
+                          such as postTGE_rewards_policy, sigma, jump_intensity, jump_mean,
+                          jump_std or buyback_rate.
+      - rng: passed to make_simulation.
+      - population: if set, passed to make_simulation as `population=` (see
+                    MonteCarloSimulation), e.g. a shared base population.
+      - combos: optional collection of (pre, airdrop, variant) name triples to run; stages
+                that no requested combo needs are skipped.
+
+    Forks of a stage start from the same random state, so all combinations see common
+    random numbers from their shared stages on.
+
+    Returns (results, TGE_tokens): results maps each name triple to its run() results,
+    TGE_tokens maps each (pre, airdrop) pair to the users' tokens after TGE.
+    """
+    base = make_simulation(rng) if population is None else make_simulation(rng, population=population)
+    results = {}
+    TGE_tokens = {}
+    for pre_name, pre_policy in preTGE_policies:
+        if combos is not None and not any(combo[0] == pre_name for combo in combos):
+            continue
+        preTGE = base.fork(preTGE_rewards_policy=pre_policy)
+        preTGE.simulate_preTGE(normalize=False)
+        for ad_name, ad_policy in airdrop_policies:
+            if combos is not None and not any(combo[:2] == (pre_name, ad_name) for combo in combos):
+                continue
+            TGE = preTGE.fork(airdrop_policy=ad_policy)
+            tge = TGE.simulate_TGE_stage()
+            TGE_tokens[(pre_name, ad_name)] = _tokens(TGE.user_pool)
+            for variant_name, params in postTGE_variants:
+                key = (pre_name, ad_name, variant_name)
+                if combos is not None and key not in combos:
+                    continue
+                postTGE = TGE.fork(**params)
+                results[key] = postTGE.combine_results(tge, postTGE.simulate_postTGE())
+    return results, TGE_tokens
@@ -1,13 +1,19 @@
 import numpy as np
+from random_streams import SHOCK_SCHEMES, as_generator, price_shocks
 
 class PostTGERewardsSimulator:
     """
     Simulator for post-TGE token price evolution using a supply/demand model
-    combined with a jump-diffusion process.
+    combined with a jump-diffusion process. `rng` is a numpy Generator or seed for the
+    price noise (see random_streams.as_generator), and `shock_scheme` one of
+    random_streams.SHOCK_SCHEMES for the shocks of several replicate paths.
     """
     def __init__(self, TGE_total, total_unlocked_history, users, base_price=10.0, elasticity=1.0,
                  buyback_rate=0.2, alpha=0.5, sigma=0.05, jump_intensity=0.1,
-                 jump_mean=-0.05, jump_std=0.1, distribution=None, demand_series=None):
+                 jump_mean=-0.05, jump_std=0.1, distribution=None, demand_series=None, rng=None,
+                 shock_scheme='plain'):
+        if shock_scheme not in SHOCK_SCHEMES:
+            raise ValueError(f"shock_scheme must be one of {SHOCK_SCHEMES}.")
         self.TGE_total = TGE_total
         self.total_unlocked_history = np.array(total_unlocked_history)
         self.users = users
@@ -21,6 +27,9 @@ class PostTGERewardsSimulator:
         self.jump_std = jump_std
         self.distribution = distribution
         self.demand_series = demand_series
+        self.rng = as_generator(rng)
+        self.shock_scheme = shock_scheme
+        self.variance_reduction_factor = None
 
     def compute_token_price(self):
         total_unlocked = self.total_unlocked_history
@@ -44,15 +53,19 @@ class PostTGERewardsSimulator:
         baseline_prices = self.base_price * (self.TGE_total / combined_supply) ** self.elasticity
         return baseline_prices
 
-    def simulate_price_evolution(self, dt=1):
+    def simulate_price_evolution(self, dt=1, replicates=None):
         """
         Simulate dynamic token price evolution with drift affected by both external demand
         and effective user activity. Effective user activity boosts the drift if active users (weighted
         by their accumulated activity) hold more tokens.
+
+        With `replicates`, returns a replicates x steps array of paths whose shocks follow
+        shock_scheme, and sets variance_reduction_factor to the factor achieved on the
+        mean final price. User state does not change here, so the activity drift is
+        computed once and the paths are built with a cumulative product.
         """
         n = len(self.total_unlocked_history)
         baseline_prices = self.compute_token_price()
-        P_jump = np.ones(n)
         
         # Process demand driver.
         if self.demand_series is not None:
@@ -82,27 +95,29 @@ class PostTGERewardsSimulator:
             # Increase a user's influence by a factor based on active_days.
             return user.tokens * (1 + 0.1 * user.active_days)
         
-        for t in range(1, n):
-            # Compute drift from external demand.
-            drift_t = base_mu + k * (normalized_demand[t] - reference)
-            log_noise = np.random.lognormal(mean=0, sigma=0.01) - 1.0
-            drift_t += log_noise
-            
-            # Compute effective active fraction.
-            total_eff = sum(effective_tokens(user) for user in self.users)
-            active_eff = sum(effective_tokens(user) for user in self.users if user.active)
-            weighted_active_fraction = (active_eff / total_eff) if total_eff > 0 else ref_activity
-            
-            # Add drift from user activity.
-            drift_t += k_activity * (weighted_active_fraction - ref_activity)
-            drift_t = np.clip(drift_t, drift_min, drift_max)
-            
-            diffusion = np.exp((drift_t - 0.5 * self.sigma**2) * dt +
-                               self.sigma * np.sqrt(dt) * np.random.randn())
-            if np.random.rand() < self.jump_intensity * dt:
-                jump = 1.0 + np.random.normal(self.jump_mean, self.jump_std)
-            else:
-                jump = 1.0
-            P_jump[t] = P_jump[t-1] * diffusion * jump
-        prices = baseline_prices * P_jump
-        return prices
\ No newline at end of file
+        # Compute effective active fraction.
+        total_eff = sum(effective_tokens(user) for user in self.users)
+        active_eff = sum(effective_tokens(user) for user in self.users if user.active)
+        weighted_active_fraction = (active_eff / total_eff) if total_eff > 0 else ref_activity
+
+        # Noise for steps 1...n-1, drawn up front.
+        shocks = price_shocks(self.rng, n - 1, replicates, self.shock_scheme)
+        log_noise = np.exp(0.01 * shocks.noise) - 1.0
+        jump_sizes = np.where(shocks.jump_uniform < self.jump_intensity * dt,
+                              1.0 + self.jump_mean + self.jump_std * shocks.jump_size, 1.0)
+
+        # Drift from external demand and user activity, one row per step.
+        drift = base_mu + k * (normalized_demand[1:] - reference)
+        if replicates is not None:
+            drift = drift[:, None]
+        drift = drift + log_noise + k_activity * (weighted_active_fraction - ref_activity)
+        drift = np.clip(drift, drift_min, drift_max)
+
+        diffusion = np.exp((drift - 0.5 * self.sigma**2) * dt + self.sigma * np.sqrt(dt) * shocks.diffusion)
+        P_jump = np.cumprod(diffusion * jump_sizes, axis=0)
+        P_jump = np.concatenate([np.ones((1,) + P_jump.shape[1:]), P_jump])
+        if replicates is None:
+            return baseline_prices * P_jump
+        prices = (baseline_prices[:, None] * P_jump).T
+        self.variance_reduction_factor = shocks.variance_reduction_factor(prices[:, -1])
+        return prices
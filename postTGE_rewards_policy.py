@@ -26,10 +26,20 @@ class GenericPostTGERewardPolicy:
     def __init__(self, engagement_policy=None):
         self.engagement_policy = engagement_policy if engagement_policy is not None else EngagementMultiplierPolicy()
     
-    def apply_rewards(self, user, active_days):
+    def apply_rewards(self, user, active_days, dt=1):
         """
         Update the user's token rewards by applying the engagement multiplier.
         Only apply if user is active. (But we check that outside in user.step already.)
+        For a step of `dt` months the multiplier is applied as multiplier ** dt, so that
+        it compounds to the same monthly rate.
         """
         multiplier = self.engagement_policy.calculate_multiplier(active_days)
-        user.tokens *= multiplier
+        user.tokens *= multiplier if dt == 1 else multiplier ** dt
+
+    def apply_rewards_batch(self, tokens, active_days, dt=1):
+        """
+        Vectorized apply_rewards: returns `tokens` scaled by the engagement multiplier
+        of each entry of `active_days`.
+        """
+        multiplier = self.engagement_policy.calculate_multiplier(active_days)
+        return tokens * (multiplier if dt == 1 else multiplier ** dt)
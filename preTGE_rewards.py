@@ -1,4 +1,5 @@
 import numpy as np
+from activity_stats import required_fields, stats_row
 
 class PreTGERewardsPolicy:
     """
@@ -6,10 +7,53 @@ class PreTGERewardsPolicy:
     
     Subclasses must implement calculate_points(activity_stats, user)
     to determine how many reward points a user earns based on their activity.
+
+    Subclasses should also declare the activity_stats keys they read in
+    `required_stats`, so that only those stats are generated. None means all
+    keys of activity_stats.STAT_FIELDS.
+
+    calculate_points_batch(activity_stats, users) is the columnar version used by
+    the user pools. It defaults to one calculate_points call per user, so policies
+    that only implement the scalar method keep working.
     """
+    required_stats = None
+
     def calculate_points(self, activity_stats, user):
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        """
+        Points for a batch of users.
+
+        Parameters:
+          - activity_stats: mapping from stat name to an array with one entry per user,
+            e.g. an activity_stats.ActivityStats.
+          - users: optional sequence of the matching user objects.
+
+        Returns a float array of points.
+        """
+        fields = required_fields(self)
+        sizes = getattr(activity_stats, 'user_size', None)
+        if sizes is not None:
+            rows = (stats_row(activity_stats, i, code, fields) for i, code in enumerate(sizes))
+        else:
+            keys = [key for key in fields if key in activity_stats]
+            rows = ({key: activity_stats[key][i] for key in keys} for i in range(_num_rows(activity_stats)))
+        return np.array([self.calculate_points(row, users[i] if users is not None else None)
+                         for i, row in enumerate(rows)], dtype=float)
+
+def _num_rows(activity_stats):
+    sizes = getattr(activity_stats, 'user_size', None)
+    if sizes is not None:
+        return len(sizes)
+    return len(next(iter(activity_stats.values()))) if len(activity_stats) else 0
+
+def _stat(activity_stats, key, default=0.0):
+    # Column of a batch of activity stats, filled with `default` if the key is missing.
+    if key in activity_stats:
+        return np.asarray(activity_stats[key], dtype=float)
+    return np.full(_num_rows(activity_stats), default)
+
 
 # ======================
 # dYdX Retroactive (Tiered Fixed Reward) Policy
@@ -39,6 +83,8 @@ class DydxRetroTieredRewardPolicy(PreTGERewardsPolicy):
       - 100,000 <= volume < 1,000,000 USD => 6,414 points
       - volume >= 1,000,000 USD => 9,529 points
     """
+    required_stats = ('trading_volume',)
+
     def __init__(self, tiers=None):
         # Parameter estimates from:
         # https://cointelegraph.com/news/dydx-airdrop-how-to-claim-310-to-9529-dydx-for-free
@@ -60,6 +106,13 @@ class DydxRetroTieredRewardPolicy(PreTGERewardsPolicy):
                 return points
         return self.tiers[-1][1]
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        # Index of the first threshold above the volume; past the end means the last tier.
+        thresholds = np.array([threshold for threshold, _ in self.tiers], dtype=float)
+        points = np.array([points for _, points in self.tiers], dtype=float)
+        tier = np.searchsorted(thresholds, _stat(activity_stats, 'trading_volume'), side='right')
+        return points[np.minimum(tier, len(points) - 1)]
+
 
 # ======================
 # Vertex (Pre-TGE) Maker/Taker Reward Policy 
@@ -86,6 +139,8 @@ class VertexMakerTakerRewardPolicy(PreTGERewardsPolicy):
     The final token distribution pre-TGE was then proportional to each user's
     total Score_i / sum(Score_j). Here, we only produce the 'points' logic.
     """
+    required_stats = ('maker_volume', 'taker_volume', 'referral_points')
+
     def __init__(self, maker_weight=0.6, taker_weight=0.3, referral_rate=0.1):
         # Parameter estimates:
         # maker_weight=0.6, taker_weight=0.3, referral_rate=0.1
@@ -104,6 +159,11 @@ class VertexMakerTakerRewardPolicy(PreTGERewardsPolicy):
                  + referrals * self.referral_rate)
         return score
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        return (_stat(activity_stats, 'maker_volume') * self.maker_weight
+                + _stat(activity_stats, 'taker_volume') * self.taker_weight
+                + _stat(activity_stats, 'referral_points') * self.referral_rate)
+
 
 # ======================
 # Jupiter Volume Tier Reward Policy
@@ -124,6 +184,8 @@ class JupiterVolumeTierRewardPolicy(PreTGERewardsPolicy):
       - volume >= 3,000,000   => 10,000 points
       - volume >= 14,000,000  => 20,000 points
     """
+    required_stats = ('swap_volume',)
+
     def __init__(self, tiers=None):
         if tiers is None:
             self.tiers = [
@@ -146,6 +208,13 @@ class JupiterVolumeTierRewardPolicy(PreTGERewardsPolicy):
                 break
         return reward
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        # Index of the last threshold reached; -1 (below the first tier) earns nothing.
+        thresholds = np.array([threshold for threshold, _ in self.tiers], dtype=float)
+        points = np.append(np.array([points for _, points in self.tiers], dtype=float), 0.0)
+        tier = np.searchsorted(thresholds, _stat(activity_stats, 'swap_volume'), side='right') - 1
+        return points[tier]
+
 
 # ======================
 # Aevo "Farm Boost" Pre-TGE Reward Policy
@@ -173,6 +242,8 @@ class AevoFarmBoostRewardPolicy(PreTGERewardsPolicy):
 
     If not present, default them to zero or an appropriate fallback.
     """
+    required_stats = ('pre_volume', 'farm_volume', 'boost_mult', 'deposit_bonus', 'early_bonus')
+
     def calculate_points(self, activity_stats, user):
         pre_vol = activity_stats.get('pre_volume', 0)
         farm_vol = activity_stats.get('farm_volume', 0)
@@ -183,6 +254,12 @@ class AevoFarmBoostRewardPolicy(PreTGERewardsPolicy):
         score = pre_vol + boost * farm_vol + deposit_bonus + early_bonus
         return score
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        return (_stat(activity_stats, 'pre_volume')
+                + _stat(activity_stats, 'boost_mult', 1.0) * _stat(activity_stats, 'farm_volume')
+                + _stat(activity_stats, 'deposit_bonus')
+                + _stat(activity_stats, 'early_bonus'))
+
 # =============================================================================
 # Generic Pre-TGE Reward Policy (Custom)
 # =============================================================================
@@ -220,12 +297,22 @@ class GenericPreTGERewardPolicy(PreTGERewardsPolicy):
         else:
             self.weights = weights
 
+    @property
+    def required_stats(self):
+        return tuple(self.weights)
+
     def calculate_points(self, activity_stats, user):
         score = 0
         for key, weight in self.weights.items():
             score += weight * activity_stats.get(key, 0)
         return score
 
+    def calculate_points_batch(self, activity_stats, users=None):
+        score = np.zeros(_num_rows(activity_stats))
+        for key, weight in self.weights.items():
+            score += weight * _stat(activity_stats, key)
+        return score
+
 # -----------------------------------------------------------------------------
 # Example usage for testing:
 # -----------------------------------------------------------------------------
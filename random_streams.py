@@ -0,0 +1,157 @@
+import warnings
+import zlib
+import numpy as np
+
+# Named streams of a RandomStreams: population attributes, activity stats,
+# post-TGE retention draws and price noise.
+STREAMS = ('population', 'stats', 'retention', 'price')
+
+def as_generator(rng=None):
+    """
+    Return a numpy.random.Generator for `rng`.
+
+    A Generator is returned as-is; an int seed or a SeedSequence seeds a new one.
+    With None the seed is drawn from the global NumPy RNG, so np.random.seed()
+    still makes a run reproducible.
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    if rng is None:
+        rng = int(np.random.randint(0, 2**63 - 1, dtype=np.int64))
+    return np.random.default_rng(rng)
+
+def draw_seed(rng):
+    """
+    An integer seed drawn from Generator `rng`, e.g. for ActivityStats.
+    """
+    return int(rng.integers(0, 2**63 - 1))
+
+def stream_id(key):
+    """
+    Stable identifier of a named stream, independent of the set and order of names.
+    """
+    return zlib.crc32(key.encode())
+
+class RandomStreams:
+    """
+    One Generator per name in STREAMS, as attributes (streams.population, ...).
+
+    RandomStreams(seed) gives every name its own Generator, seeded from (seed, name),
+    for common random numbers: simulations built from RandomStreams with the same seed
+    draw the same population, activity stats, retention uniforms and price shocks
+    whatever their policies, so differences between them are paired instead of
+    independent Monte Carlo noise. The draws of a stream do not depend on how many
+    numbers the other streams consumed.
+
+    RandomStreams(shared=rng) puts every name on the single Generator `rng`.
+    A RandomStreams is consumed by the simulation it is given to; build (or unpickle)
+    a fresh one with the same seed for each paired run.
+    """
+    def __init__(self, seed=None, shared=None):
+        if shared is not None:
+            self.seed = None
+            for name in STREAMS:
+                setattr(self, name, shared)
+            return
+        if seed is None:
+            seed = draw_seed(as_generator())
+        sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.seed = seed
+        for name in STREAMS:
+            child = np.random.SeedSequence(sequence.entropy, spawn_key=sequence.spawn_key + (stream_id(name),))
+            setattr(self, name, np.random.default_rng(child))
+
+def as_streams(rng=None):
+    """
+    RandomStreams for `rng`: a RandomStreams is returned as-is, anything accepted by
+    as_generator becomes one Generator shared by all streams.
+    """
+    if isinstance(rng, RandomStreams):
+        return rng
+    return RandomStreams(shared=as_generator(rng))
+
+# Shock schemes accepted by price_shocks.
+SHOCK_SCHEMES = ('plain', 'antithetic', 'sobol')
+
+# Independently scrambled Sobol sequences per price_shocks call; their spread
+# gives the variance estimate of the 'sobol' scheme.
+SOBOL_SCRAMBLES = 8
+
+class PriceShocks:
+    """
+    Standardized shocks of a jump-diffusion price path, one row per step and, with
+    replicates, one column per replicate:
+      - diffusion, noise, jump_size: standard normals (diffusion shock, drift noise,
+        jump size),
+      - jump_uniform: uniforms, a jump occurs where jump_uniform < intensity * dt.
+
+    Replicates come in groups of `group_size` whose means are independent (antithetic
+    pairs, Sobol scramblings, or single plain draws), which variance_reduction_factor uses.
+    """
+    FIELDS = ('diffusion', 'noise', 'jump_uniform', 'jump_size')
+
+    def __init__(self, diffusion, noise, jump_uniform, jump_size, group_size=1):
+        self.diffusion = diffusion
+        self.noise = noise
+        self.jump_uniform = jump_uniform
+        self.jump_size = jump_size
+        self.group_size = group_size
+
+    def variance_reduction_factor(self, values):
+        """
+        Estimated variance-reduction factor of the mean of `values` (one per replicate,
+        e.g. final prices): the variance of a plain Monte Carlo mean over the same number
+        of replicates divided by the variance achieved, estimated from the group means.
+        Replicates in an incomplete last group are left out. NaN with fewer than two groups.
+        """
+        values = np.asarray(values, dtype=float)
+        m = self.group_size
+        n = len(values) // m * m
+        if n < 2 * m:
+            return np.nan
+        achieved = values[:n].reshape(-1, m).mean(axis=1).var(ddof=1) / (n // m)
+        plain = values[:n].var(ddof=1) / n
+        return plain / achieved if achieved > 0 else np.inf
+
+def price_shocks(rng, num_steps, replicates=None, scheme='plain'):
+    """
+    PriceShocks for `num_steps` steps of `replicates` paths (a single path if None),
+    drawn from Generator `rng` with one of SHOCK_SCHEMES:
+      - 'plain': independent pseudo-random draws,
+      - 'antithetic': replicates in pairs (2i, 2i+1) with negated normals and mirrored
+        uniforms,
+      - 'sobol': scrambled Sobol points mapped through the inverse normal CDF, one
+        dimension per step and shock, in SOBOL_SCRAMBLES independently scrambled
+        groups (requires scipy).
+    The variance-reduction schemes need at least two replicates.
+    """
+    if scheme not in SHOCK_SCHEMES:
+        raise ValueError(f"Unknown shock scheme {scheme!r}; expected one of {SHOCK_SCHEMES}.")
+    if scheme == 'plain':
+        shape = (num_steps,) if replicates is None else (num_steps, replicates)
+        return PriceShocks(rng.standard_normal(shape), rng.standard_normal(shape),
+                           rng.random(shape), rng.standard_normal(shape))
+    if replicates is None or replicates < 2:
+        raise ValueError(f"The {scheme!r} shock scheme needs at least two replicates.")
+
+    if scheme == 'antithetic':
+        half = (replicates + 1) // 2
+        normals = rng.standard_normal((3, num_steps, half))
+        uniforms = rng.random((num_steps, half))
+        normals = np.stack([normals, -normals], axis=-1).reshape(3, num_steps, 2 * half)[..., :replicates]
+        uniforms = np.stack([uniforms, 1.0 - uniforms], axis=-1).reshape(num_steps, 2 * half)[:, :replicates]
+        return PriceShocks(normals[0], normals[1], uniforms, normals[2], group_size=2)
+
+    from scipy.stats import qmc
+    from scipy.special import ndtri
+    group_size = -(-replicates // min(SOBOL_SCRAMBLES, replicates))
+    points = []
+    with warnings.catch_warnings():
+        # Group sizes need not be powers of two.
+        warnings.simplefilter('ignore', UserWarning)
+        for _ in range(-(-replicates // group_size)):
+            points.append(qmc.Sobol(4 * num_steps, scramble=True, seed=rng).random(group_size))
+    # Dimensions ordered by importance: the earliest Sobol dimensions are the most uniform.
+    u = np.concatenate(points)[:replicates].T.reshape(4, num_steps, replicates)
+    u = np.clip(u, 1e-12, 1 - 1e-12)
+    return PriceShocks(ndtri(u[0]), ndtri(u[3]), u[1], ndtri(u[2]), group_size=group_size)
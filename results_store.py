@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from collections.abc import Mapping
+import numpy as np
+from checkpoint import json_default
+
+# Per-result metadata file; written last, so a result directory without it is incomplete.
+META = 'meta.json'
+
+def _is_array(value):
+    return isinstance(value, (np.ndarray, list, tuple)) and np.ndim(value) >= 1
+
+def _is_table(value):
+    # Dicts of equal-length series (e.g. unlocked_history) are stored as one 2-D array.
+    return (isinstance(value, dict) and value and all(_is_array(v) for v in value.values())
+            and len({np.shape(v) for v in value.values()}) == 1)
+
+class ResultHandle:
+    """
+    Small picklable reference to one result in a ResultsStore, returned by worker
+    processes instead of the result itself.
+    """
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+
+    def load(self):
+        return ResultsStore(self.directory)[self.key]
+
+    def __repr__(self):
+        return f"ResultHandle({self.directory!r}, {self.key!r})"
+
+class ResultsStore(Mapping):
+    """
+    On-disk columnar store of simulation results, keyed by combo name.
+
+    Each result is a directory holding one .npy file per array (price path, active
+    fraction, unlock histories, TGE token vector, ...) and a meta.json with the scalar
+    and small dict entries. Results are read back with their arrays memory-mapped, so
+    plots can be redrawn from a finished run without rerunning or loading every combo.
+
+    write() accepts a results dict as returned by run(): arrays and numeric lists become
+    arrays, dicts of equal-length series become one 2-D array with the dict keys kept in
+    meta.json, everything else must be JSON-serializable. Separate processes can write
+    different keys to the same store concurrently.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        slug = re.sub(r'[^A-Za-z0-9._-]+', '_', key).strip('_')
+        return os.path.join(self.directory, f"{slug}-{zlib.crc32(key.encode()):08x}")
+
+    def write(self, key, results):
+        """
+        Store `results` under `key`, replacing any previous result, and return its
+        ResultHandle. The result appears complete or not at all.
+        """
+        meta = {'key': key, 'arrays': [], 'tables': {}, 'values': {}}
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            for name, value in results.items():
+                if _is_array(value):
+                    np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(value))
+                    meta['arrays'].append(name)
+                elif _is_table(value):
+                    np.save(os.path.join(tmp_dir, f"{name}.npy"), np.stack([np.asarray(v) for v in value.values()]))
+                    meta['tables'][name] = list(value)
+                else:
+                    meta['values'][name] = value
+            with open(os.path.join(tmp_dir, META), 'w') as f:
+                json.dump(meta, f, default=json_default)
+            path = self._path(key)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return ResultHandle(self.directory, key)
+
+    def __getitem__(self, key):
+        """
+        The stored results dict of `key`, with its arrays memory-mapped read-only.
+        """
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, META)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        results = dict(meta['values'])
+        for name in meta['arrays']:
+            results[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+        for name, labels in meta['tables'].items():
+            table = np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            results[name] = dict(zip(labels, table))
+        return results
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._path(key), META))
+
+    def __iter__(self):
+        for name in sorted(os.listdir(self.directory)):
+            meta_path = os.path.join(self.directory, name, META)
+            if not name.startswith('.') and os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    yield json.load(f)['key']
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        """
+        Delete every stored result (and leftovers of interrupted writes), e.g. before a
+        new sweep whose grid may differ from the stored one. Other files are kept.
+        """
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and (name.startswith('.tmp-') or os.path.exists(os.path.join(path, META))):
+                shutil.rmtree(path)
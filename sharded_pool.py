@@ -0,0 +1,154 @@
+import multiprocessing
+import traceback
+import numpy as np
+from airdrop_policy import AirdropPolicy
+from user_pool import ColumnarUserPool, DEFAULT_SYBIL_FRACTION
+from random_streams import RandomStreams
+from users import SEGMENTS
+
+def _shard_worker(conn, num_users, airdrop_policy, sybil_fraction, size_mix, seed_sequence):
+    """
+    Worker loop: owns one ColumnarUserPool shard and executes the pool methods
+    requested by the parent, sending back their (small) return values.
+    """
+    pool = ColumnarUserPool(num_users=num_users, airdrop_policy=airdrop_policy,
+                            sybil_fraction=sybil_fraction, size_mix=size_mix,
+                            rng=RandomStreams(seed_sequence))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        method, args, kwargs = message
+        try:
+            conn.send(('ok', getattr(pool, method)(*args, **kwargs)))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+class ShardedUserPool:
+    """
+    Splits a population across worker processes, each owning a ColumnarUserPool shard
+    with independent RandomStreams (seeded by the children of one SeedSequence).
+
+    It exposes the pool methods used by MonteCarloSimulation. Each call runs on all
+    shards in parallel and only scalar results (sums, maxima, per-segment totals)
+    travel back to be reduced here, so one post-TGE month costs two round trips.
+
+    Shard populations are generated independently, so per-segment counts can differ
+    from a single UserPool of the same size by the per-shard rounding.
+    """
+    def __init__(self, num_users, airdrop_policy=None, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None,
+                 num_shards=None, seed=None):
+        self.num_users = num_users
+        self.airdrop_policy = airdrop_policy if airdrop_policy is not None else AirdropPolicy()
+        self.num_shards = num_shards if num_shards is not None else multiprocessing.cpu_count()
+        self.shard_sizes = [len(part) for part in np.array_split(np.arange(num_users), self.num_shards)]
+
+        seeds = np.random.SeedSequence(seed).spawn(self.num_shards)
+        self._connections = []
+        self._processes = []
+        self._gathered = {}
+        for shard_size, shard_seed in zip(self.shard_sizes, seeds):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker,
+                args=(child_conn, shard_size, self.airdrop_policy, sybil_fraction, size_mix, shard_seed),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Run `method` on every shard in parallel and return the list of results.
+        """
+        if not self._connections:
+            raise RuntimeError("ShardedUserPool is closed.")
+        for conn in self._connections:
+            conn.send((method, args, kwargs))
+        results = []
+        errors = []
+        for conn in self._connections:
+            status, value = conn.recv()
+            if status == 'ok':
+                results.append(value)
+            else:
+                errors.append(value)
+        if errors:
+            raise RuntimeError(f"Shard failed while running {method}:\n{errors[0]}")
+        return results
+
+    def step_all(self, phase):
+        self._call('step_all', phase)
+
+    def accrue_preTGE(self, n_steps):
+        self._call('accrue_preTGE', n_steps)
+
+    def add_preTGE_rewards(self, preTGE_rewards_policy):
+        self._call('add_preTGE_rewards', preTGE_rewards_policy)
+
+    def max_airdrop_points(self):
+        return max(self._call('max_airdrop_points'))
+
+    def normalize_airdrop_points(self, max_points):
+        self._call('normalize_airdrop_points', max_points)
+
+    def total_tokens(self):
+        return sum(self._call('total_tokens'))
+
+    def scale_tokens(self, factor):
+        self._call('scale_tokens', factor)
+
+    def segment_tokens(self):
+        totals = {segment: 0.0 for segment in SEGMENTS}
+        for shard_totals in self._call('segment_tokens'):
+            for segment, tokens in shard_totals.items():
+                totals[segment] += tokens
+        return totals
+
+    def convert_tokens(self, max_points=1):
+        shard_results = self._call('convert_tokens', max_points)
+        return (sum(r[0] for r in shard_results), sum(r[1] for r in shard_results),
+                sum(r[2] for r in shard_results))
+
+    def step_postTGE(self, current_price=None, baseline_price=None, postTGE_rewards_policy=None, dt=1):
+        return sum(self._call('step_postTGE', current_price, baseline_price, postTGE_rewards_policy, dt))
+
+    def effective_weights(self, beta=1.0):
+        shard_weights = self._call('effective_weights', beta)
+        return sum(w[0] for w in shard_weights), sum(w[1] for w in shard_weights)
+
+    def gather(self, column):
+        """
+        Concatenate one ColumnarUserPool column (e.g. 'tokens') across shards. After
+        close() only the columns it kept are available.
+        """
+        if not self._connections and column in self._gathered:
+            return self._gathered[column]
+        return np.concatenate(self._call('__getattribute__', column))
+
+    def close(self, keep_columns=()):
+        """
+        Shut down the shard workers. The columns in `keep_columns` are gathered first and
+        stay available through gather(); every other pool method raises afterwards.
+        """
+        if self._connections:
+            self._gathered = {column: self.gather(column) for column in keep_columns}
+        for conn in self._connections:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
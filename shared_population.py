@@ -0,0 +1,100 @@
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+import numpy as np
+from user_pool import base_population, DEFAULT_SYBIL_FRACTION
+
+class SharedPopulation(Mapping):
+    """
+    Base population columns (see user_pool.base_population) published once in a block
+    of shared memory, for ColumnarUserPool(population=...) in many worker processes.
+
+    The process that creates a SharedPopulation owns the block. Pickling it, e.g. as a
+    ProcessPoolExecutor task argument, only sends the block name and layout: the copy in
+    the worker attaches to the same memory, so per-task setup neither redraws nor copies
+    the population. Columns are read-only views; pools allocate their own
+    MUTABLE_COLUMNS (airdrop_points, tokens, active, active_days), so writes never reach
+    the shared block.
+
+    Use it as a context manager, or call close() (and unlink() in the owner) when done.
+    """
+    def __init__(self, columns):
+        arrays = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+        self._layout = []
+        size = 0
+        for name, values in arrays.items():
+            size = -(-size // 8) * 8  # 8-byte aligned columns
+            self._layout.append((name, values.dtype.str, values.shape, size))
+            size += values.nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._owner = True
+        self._map_columns()
+        for name, values in arrays.items():
+            column = self._columns[name]
+            column.flags.writeable = True
+            column[...] = values
+            column.flags.writeable = False
+
+    @classmethod
+    def generate(cls, num_users, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None, rng=None):
+        """
+        Draw a base population (from `rng` like ColumnarUserPool does from its population
+        stream) straight into shared memory.
+        """
+        return cls(base_population(num_users, sybil_fraction, size_mix, rng))
+
+    def _map_columns(self):
+        self._columns = {}
+        for name, dtype, shape, offset in self._layout:
+            column = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+            column.flags.writeable = False
+            self._columns[name] = column
+
+    def __getstate__(self):
+        return {'name': self._shm.name, 'layout': self._layout}
+
+    def __setstate__(self, state):
+        # Attaching registers the block with the resource tracker that the workers
+        # share with the owner, where it is already registered; only unlink() removes it.
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._layout = state['layout']
+        self._owner = False
+        self._map_columns()
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    @property
+    def num_users(self):
+        return len(self._columns['user_id'])
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def close(self):
+        """
+        Detach from the block. Pools built on this population (which hold views of it)
+        must be released first.
+        """
+        self._columns = {}
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Free the block (owner only) once no process needs it any more.
+        """
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.unlink()
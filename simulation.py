@@ -1,20 +1,91 @@
+import copy
+import os
 import numpy as np
-from user_pool import UserPool
+from user_pool import UserPool, ColumnarUserPool, Cohorts
+from sharded_pool import ShardedUserPool
+from chunked_pool import ChunkedUserPool
 from vesting import PostTGERewardsManager
 from preTGE_rewards import GenericPreTGERewardPolicy
 from postTGE_rewards_policy import GenericPostTGERewardPolicy
 from airdrop_policy import LinearAirdropPolicy
-from users import RegularUser, SybilUser
-from activity_stats import generate_stats
+from users import SEGMENTS, accrue_airdrop_points
+from activity_stats import ActivityStats, DETERMINISTIC_STATS, required_fields
+from random_streams import SHOCK_SCHEMES, PriceShocks, as_streams, draw_seed, price_shocks
+from checkpoint import (checkpoint_name, write_checkpoint, read_checkpoint, latest_checkpoint, prune_checkpoints,
+                        generator_states, restore_generator_states)
+
+# Percentiles reported as bands over replicates.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Cohorts attributes saved in checkpoints.
+COHORT_ARRAYS = Cohorts.KEY_COLUMNS + ('first', 'inverse', 'counts', 'tokens')
 
 class MonteCarloSimulation:
     def __init__(self, num_users=1500000, total_supply=100_000_000, preTGE_steps=100, simulation_horizon=60,
                  airdrop_policy=None, preTGE_rewards_policy=None, postTGE_rewards_policy=None, airdrop_allocation_fraction=0.15,
-                 initial_price=10.0, buyback_rate=0.2, elasticity=0.5, demand_series=None):
+                 initial_price=10.0, buyback_rate=0.2, elasticity=0.5, demand_series=None, columnar=False,
+                 sybil_fraction=0.3, size_mix=None, cohort_compression=False, num_shards=1,
+                 memory_budget=None, vesting=None, postTGE_dt=1.0, replicates=1, rng=None,
+                 shock_scheme='plain', sigma=0.2, jump_intensity=0.3, jump_mean=-0.1, jump_std=0.15,
+                 checkpoint_dir=None, checkpoint_every=12, population=None):
         """
         Parameters:
+          - sigma, jump_intensity, jump_mean, jump_std: Monthly volatility and jump process
+                        (arrival rate per month, mean and std of the relative jump size)
+                        of the post-TGE price multiplier.
           - demand_series: Array-like sequence of raw demand values that will drive drift.
+          - columnar: If True, store users in a ColumnarUserPool (NumPy arrays) instead of
+                      one Python object per user.
+          - sybil_fraction, size_mix: Population segment mix (see user_pool.segment_counts).
+          - cohort_compression: If True (requires columnar), pre-TGE and TGE run once per cohort
+                                of users with identical pre-TGE state instead of once per user.
+          - num_shards: If > 1, split the population into columnar shards owned by that many
+                        worker processes (see sharded_pool.ShardedUserPool).
+          - memory_budget: If set (bytes), keep users in a disk-backed ChunkedUserPool whose
+                           chunk size is chosen so that peak memory stays within the budget.
+          - vesting: Source of the unlock schedule, e.g. a vesting.VestingLedger of individual
+                     grants. Defaults to the group schedules of PostTGERewardsManager.
+          - postTGE_dt: Post-TGE step length in months, e.g. 1/30 for daily or 7/30 for weekly
+                        steps (see simulate_postTGE). Must be in (0, 1].
+          - replicates: Number of independent post-TGE price paths and user-state replicates
+                        advanced together from the same TGE outcome (requires columnar).
+                        With replicates > 1, run() reports median paths and PERCENTILES bands.
+          - rng: numpy Generator, int seed or SeedSequence driving every random draw of the run
+                 (population, activity stats, retention and price noise). A fixed seed makes
+                 the run reproducible; by default it is seeded from the global NumPy RNG.
+                 A random_streams.RandomStreams keeps each of these on its own named stream:
+                 runs given RandomStreams with the same seed use common random numbers, so
+                 policy comparisons between them are paired.
+          - shock_scheme: How the price shocks of the replicates are drawn, one of
+                          random_streams.SHOCK_SCHEMES: 'plain', 'antithetic' pairs or
+                          scrambled 'sobol' points (see random_streams.price_shocks). The
+                          variance-reduction schemes need replicates > 1; run() then reports
+                          the variance_reduction_factor achieved on the mean final price.
+          - checkpoint_dir: If set, run() writes checkpoints there after pre-TGE, after TGE
+                            and every `checkpoint_every` post-TGE months, and run(resume=True)
+                            continues from the latest one (see run). Requires a columnar pool
+                            (columnar=True or memory_budget).
+          - population: Base population columns to use instead of drawing them, e.g. a
+                        shared_population.SharedPopulation published once for many worker
+                        processes (requires an in-memory columnar pool). With RandomStreams
+                        the run is the same as if its population stream had drawn them.
         """
+        if shock_scheme not in SHOCK_SCHEMES:
+            raise ValueError(f"shock_scheme must be one of {SHOCK_SCHEMES}.")
+        if shock_scheme != 'plain' and replicates < 2:
+            raise ValueError(f"shock_scheme={shock_scheme!r} requires replicates > 1.")
+        if not 0 < postTGE_dt <= 1:
+            raise ValueError("postTGE_dt must be in (0, 1] months.")
+        if cohort_compression and not columnar:
+            raise ValueError("cohort_compression requires columnar=True.")
+        if cohort_compression and (num_shards > 1 or memory_budget is not None):
+            raise ValueError("cohort_compression is not supported with num_shards > 1 or memory_budget.")
+        if replicates > 1 and (not columnar or num_shards > 1 or memory_budget is not None):
+            raise ValueError("replicates > 1 requires an in-memory columnar pool (columnar=True, "
+                             "num_shards=1, no memory_budget).")
+        if population is not None and (not columnar or num_shards > 1 or memory_budget is not None):
+            raise ValueError("population requires an in-memory columnar pool (columnar=True, "
+                             "num_shards=1, no memory_budget).")
         self.num_users = num_users
         self.total_supply = total_supply
         self.preTGE_steps = preTGE_steps
@@ -25,29 +96,123 @@ class MonteCarloSimulation:
         self.initial_price = initial_price
         self.buyback_rate = buyback_rate
         self.elasticity = elasticity
+        self.streams = as_streams(rng)
 
-        self.user_pool = UserPool(num_users=self.num_users, airdrop_policy=self.airdrop_policy)
-        self.post_tge_manager = PostTGERewardsManager(total_supply=self.total_supply)
+        if num_shards > 1:
+            self.user_pool = ShardedUserPool(num_users=self.num_users, airdrop_policy=self.airdrop_policy,
+                                             sybil_fraction=sybil_fraction, size_mix=size_mix,
+                                             num_shards=num_shards, seed=draw_seed(self.streams.population))
+        elif memory_budget is not None:
+            self.user_pool = ChunkedUserPool(num_users=self.num_users, airdrop_policy=self.airdrop_policy,
+                                             sybil_fraction=sybil_fraction, size_mix=size_mix,
+                                             memory_budget=memory_budget, rng=self.streams)
+        else:
+            pool_cls = ColumnarUserPool if columnar else UserPool
+            pool_kwargs = {'population': population} if population is not None else {}
+            self.user_pool = pool_cls(num_users=self.num_users, airdrop_policy=self.airdrop_policy,
+                                      sybil_fraction=sybil_fraction, size_mix=size_mix, rng=self.streams,
+                                      **pool_kwargs)
+        self.post_tge_manager = vesting if vesting is not None else PostTGERewardsManager(total_supply=self.total_supply)
         self.airdrop_allocation_fraction = airdrop_allocation_fraction
         self.demand_series = demand_series
+        self.cohort_compression = cohort_compression
+        self.postTGE_dt = postTGE_dt
+        self.replicates = replicates
+        self.shock_scheme = shock_scheme
+        self.sigma = sigma
+        self.jump_intensity = jump_intensity
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        if checkpoint_dir is not None and not hasattr(self.user_pool, 'checkpoint_arrays'):
+            raise ValueError("checkpoint_dir requires a columnar pool (columnar=True or memory_budget).")
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self._tge = None
+        self._cohorts = None
+
+    def fork(self, **params):
+        """
+        A new simulation continuing from this one's current state (user pool, cohorts and
+        random streams are copied) with some attributes replaced, e.g.
+        fork(airdrop_policy=...) after simulate_preTGE, or
+        fork(postTGE_rewards_policy=..., sigma=0.1) after simulate_TGE_stage.
+
+        Forks of the same state draw the same random numbers, so they are paired.
+        Not supported for sharded pools.
+        """
+        if not hasattr(self.user_pool, 'copy'):
+            raise ValueError("fork requires a pool with copy(); sharded pools cannot be forked.")
+        child = copy.copy(self)
+        for name, value in params.items():
+            if not hasattr(child, name):
+                raise TypeError(f"MonteCarloSimulation has no parameter {name!r}.")
+            setattr(child, name, value)
+        child.user_pool = self.user_pool.copy()
+        child.user_pool.set_airdrop_policy(child.airdrop_policy)
+        child.streams = child.user_pool.streams
+        child._cohorts = copy.deepcopy(self._cohorts)
+        return child
+
+    def simulate_preTGE(self, normalize=True):
+        """
+        Accrue pre-TGE airdrop points and add the pre-TGE rewards. With normalize=False
+        the points are left unnormalized for simulate_TGE_stage, which normalizes them
+        in its conversion pass.
+        """
+        if self.cohort_compression:
+            self._simulate_preTGE_cohorts()
+            return
 
-    def simulate_preTGE(self):
-        for _ in range(self.preTGE_steps):
-            self.user_pool.step_all('PreTGE')
+        self.user_pool.accrue_preTGE(self.preTGE_steps)
         
         if self.preTGE_rewards_policy is not None:
-            for user in self.user_pool.users:
-                stats = generate_stats(user)
-                user.airdrop_points += self.preTGE_rewards_policy.calculate_points(stats, user)
+            self.user_pool.add_preTGE_rewards(self.preTGE_rewards_policy)
         
-        max_points = max(u.airdrop_points for u in self.user_pool.users) or 1
-        for u in self.user_pool.users:
-            u.airdrop_points /= max_points
+        if normalize:
+            max_points = self.user_pool.max_airdrop_points() or 1
+            self.user_pool.normalize_airdrop_points(max_points)
+
+    def _simulate_preTGE_cohorts(self):
+        """
+        Cohort-compressed pre-TGE: points accrue once per cohort of identical users.
+        They are expanded to individual users only when the pre-TGE rewards policy
+        needs randomly drawn activity stats; otherwise the cohorts are kept for simulate_TGE.
+        """
+        cohorts = self.user_pool.cohorts()
+        points = accrue_airdrop_points(cohorts.airdrop_points, cohorts.interaction_rate,
+                                       cohorts.endowment, cohorts.decay_rate, self.preTGE_steps)
+        policy = self.preTGE_rewards_policy
+        if policy is not None and set(required_fields(policy)) <= set(DETERMINISTIC_STATS):
+            # Stats like trading_volume are identical within a cohort.
+            stats = ActivityStats(cohorts.user_size, cohorts.endowment, seed=draw_seed(self.streams.stats))
+            users = self.user_pool.users
+            points = points + policy.calculate_points_batch(stats, [users[i] for i in cohorts.first])
+            policy = None
+        if policy is not None:
+            pool = self.user_pool
+            pool.airdrop_points = points[cohorts.inverse]
+            pool.add_preTGE_rewards(policy)
+            pool.normalize_airdrop_points(pool.max_airdrop_points() or 1)
+            self._cohorts = None
+        else:
+            cohorts.airdrop_points = points / (points.max() or 1)
+            self._cohorts = cohorts
 
     def simulate_TGE(self):
+        if self._cohorts is not None:
+            # One conversion per cohort, using a representative member.
+            cohorts = self._cohorts
+            users = self.user_pool.users
+            cohorts.tokens = self.airdrop_policy.calculate_tokens_batch(cohorts.airdrop_points,
+                                                                        [users[i] for i in cohorts.first])
+            self.user_pool.airdrop_points = cohorts.airdrop_points[cohorts.inverse]
+            self.user_pool.tokens = cohorts.tokens[cohorts.inverse]
+            return
         self.user_pool.step_all('TGE')
     
-    def simulate_postTGE(self):
+    def simulate_postTGE(self, resume=None):
         """
         Simulate the post-TGE phase by, for each time step:
           - Computing a vesting-based baseline price from unlocked allocations,
@@ -62,31 +227,57 @@ class MonteCarloSimulation:
         
         with β=1.0 (by default). Then the weighted active fraction is computed over all users
         and is used to boost (or depress) drift.
+
+        Steps are postTGE_dt months long. Drift and volatility enter the multiplier scaled by
+        dt and sqrt(dt), the drift noise sigma by 1/sqrt(dt) (so its monthly variance is
+        unchanged) and jumps occur with probability jump_intensity * dt. The monthly demand
+        series is linearly interpolated and vesting is evaluated at fractional months.
+        Users redraw their activity with probability dt per step (see RegularUser.step).
+        The returned "months" are the step times in months.
+
+        The price noise of all steps (drift noise, diffusion shocks, jump arrivals and
+        sizes) is drawn from the price stream in one block per kind before the loop,
+        with the shock_scheme (see random_streams.price_shocks).
+
+        With replicates > 1 all replicates advance together (see
+        user_pool.ReplicatedPostTGEState): "dynamic_prices" and "active_fraction_history"
+        are replicates x steps arrays, and "variance_reduction_factor" estimates what the
+        shock_scheme achieved on the mean final price (about 1 for 'plain').
+
+        With checkpoint_dir set, a checkpoint is written every checkpoint_every months.
+        `resume` is the (arrays, state) of such a checkpoint, restored by run(resume=True),
+        to continue after its step.
         """
-        months = np.arange(0, self.simulation_horizon + 1)
-        num_steps = len(months)
+        dt = self.postTGE_dt
+        num_months = self.simulation_horizon + 1
+        num_steps = int(round(self.simulation_horizon / dt)) + 1
+        months = np.arange(num_steps) * dt if dt != 1 else np.arange(num_steps)
         
         # Normalize the demand series.
         if self.demand_series is not None:
             demand_values = np.array(self.demand_series, dtype=float)
             max_demand = demand_values.max()
             normalized_demand = demand_values / max_demand
-            if len(normalized_demand) < num_steps:
-                pad_length = num_steps - len(normalized_demand)
+            if len(normalized_demand) < num_months:
+                pad_length = num_months - len(normalized_demand)
                 normalized_demand = np.pad(normalized_demand, (0, pad_length),
                                            mode='constant', constant_values=normalized_demand[-1])
             else:
-                normalized_demand = normalized_demand[:num_steps]
+                normalized_demand = normalized_demand[:num_months]
         else:
-            normalized_demand = np.ones(num_steps) * 0.5
+            normalized_demand = np.ones(num_months) * 0.5
+        if dt != 1:
+            normalized_demand = np.interp(months, np.arange(num_months), normalized_demand)
         
-        total_unlocked_history = []
-        unlocked_history = {group: [] for group in self.post_tge_manager.schedules.keys()}
-
-        # Precompute baseline constants.
-        TGE_total = self.airdrop_allocation_fraction * self.total_supply
-        allocations0 = self.post_tge_manager.get_unlocked_allocations(0)
-        unlocked_at_TGE_total = sum(allocations0.values())
+        # Vesting-based baseline prices do not depend on user state: compute the whole curve.
+        if dt == 1:
+            unlocked = self.post_tge_manager.unlock_matrix(num_steps)
+        else:
+            unlocked = self.post_tge_manager.unlocked_by_group(months)
+        total_unlocked = unlocked.sum(axis=0)
+        baseline_prices = self.baseline_price_curve(total_unlocked)
+        total_unlocked_history = total_unlocked.tolist()
+        unlocked_history = {group: row.tolist() for group, row in zip(self.post_tge_manager.groups, unlocked)}
         
         # Parameters for drift and diffusion.
         base_mu = 0.0
@@ -96,135 +287,277 @@ class MonteCarloSimulation:
         ref_activity = 0.5       # Reference effective active fraction.
         drift_min = -1.0
         drift_max = 1.0
-        sigma = 0.2
-        jump_intensity = 0.3
-        jump_mean = -0.1
-        jump_std = 0.15
-        dt = 1
+        sigma = self.sigma
+        jump_intensity = self.jump_intensity
+        jump_mean = self.jump_mean
+        jump_std = self.jump_std
+        drift_noise_sigma = 0.01 / np.sqrt(dt)
 
         # Parameter for endowment influence.
         beta = 1.0
 
-        final_prices = np.zeros(num_steps)
-        active_fraction_history = np.zeros(num_steps)
-
-        # Time step 0: compute baseline price.
-        alloc = self.post_tge_manager.get_unlocked_allocations(0)
-        total_unlocked = sum(alloc.values())
-        total_unlocked_history.append(total_unlocked)
-        for group, tokens in alloc.items():
-            unlocked_history[group].append(tokens)
-        circulating_supply = TGE_total + (total_unlocked - unlocked_at_TGE_total)
-        effective_supply = TGE_total + (total_unlocked - unlocked_at_TGE_total) * (1 - self.buyback_rate)
-        combined_supply = 0.5 * (circulating_supply + effective_supply)
-        baseline = self.initial_price * (TGE_total / combined_supply) ** self.elasticity
-        final_prices[0] = baseline
-        active_fraction_history[0] = 0.1
+        replicates = self.replicates
+        if replicates > 1:
+            user_state = self.user_pool.replicate(replicates)
+            final_prices = np.zeros((replicates, num_steps))
+            active_fraction_history = np.zeros((replicates, num_steps))
+        else:
+            user_state = self.user_pool
+            final_prices = np.zeros(num_steps)
+            active_fraction_history = np.zeros(num_steps)
+
+        if resume is None:
+            final_prices[..., 0] = baseline_prices[0]
+            active_fraction_history[..., 0] = 0.1
+            # Noise for steps 1...T, one row per step.
+            shocks = price_shocks(self.streams.price, num_steps - 1, replicates if replicates > 1 else None,
+                                  self.shock_scheme)
+            start = 1
+        else:
+            arrays, state = resume
+            final_prices[...] = arrays['post/prices']
+            active_fraction_history[...] = arrays['post/active_fraction']
+            shocks = PriceShocks(*(np.array(arrays[f'shocks/{name}']) for name in PriceShocks.FIELDS),
+                                 group_size=state['shock_group_size'])
+            if replicates > 1:
+                user_state.restore_checkpoint({name: arrays[f'replicates/{name}']
+                                               for name in user_state.CHECKPOINT_ARRAYS})
+            start = state['step'] + 1
+        checkpoint_steps = max(1, int(round(self.checkpoint_every / dt)))
+        log_noise = np.exp(drift_noise_sigma * shocks.noise) - 1.0
+        jump_sizes = np.where(shocks.jump_uniform < jump_intensity * dt,
+                              1.0 + jump_mean + jump_std * shocks.jump_size, 1.0)
 
         # For time steps 1...T.
-        for t in range(1, num_steps):
-            # Compute the vesting-based baseline price for time t.
-            alloc = self.post_tge_manager.get_unlocked_allocations(t)
-            tot_unlocked = sum(alloc.values())
-            total_unlocked_history.append(tot_unlocked)
-            for group, tokens in alloc.items():
-                unlocked_history[group].append(tokens)
-            circulating_supply = TGE_total + (tot_unlocked - unlocked_at_TGE_total)
-            effective_supply = TGE_total + (tot_unlocked - unlocked_at_TGE_total) * (1 - self.buyback_rate)
-            combined_supply = 0.5 * (circulating_supply + effective_supply)
-            baseline = self.initial_price * (TGE_total / combined_supply) ** self.elasticity
+        for t in range(start, num_steps):
+            baseline = baseline_prices[t]
 
             # Compute drift from external demand.
             drift = base_mu + k * (normalized_demand[t] - reference)
-            log_noise = np.random.lognormal(mean=0, sigma=0.01) - 1.0
-            drift += log_noise
-
-            # Compute effective user weight across the population.
-            total_eff = 0.0
-            active_eff = 0.0
-            for user in self.user_pool.users:
-                # Now incorporating both tokens and endowment.
-                eff = user.tokens * (1 + 0.1 * user.active_days) + beta * user.endowment
-                total_eff += eff
-                if user.active:
-                    active_eff += eff
-            weighted_active_fraction = (active_eff / total_eff) if total_eff > 0 else ref_activity
+            drift += log_noise[t - 1]
+
+            # Compute effective user weight across the population,
+            # incorporating both tokens and endowment.
+            total_eff, active_eff = user_state.effective_weights(beta)
+            weighted_active_fraction = np.where(total_eff > 0, active_eff / np.where(total_eff > 0, total_eff, 1),
+                                                ref_activity)
             drift += k_activity * (weighted_active_fraction - ref_activity)
             drift = np.clip(drift, drift_min, drift_max)
 
             # Compute the one-period multiplier from jump-diffusion.
             multiplier = np.exp((drift - 0.5 * sigma**2) * dt +
-                                  sigma * np.sqrt(dt) * np.random.randn())
-            if np.random.rand() < jump_intensity * dt:
-                multiplier *= (1.0 + np.random.normal(jump_mean, jump_std))
-            final_prices[t] = baseline * multiplier
+                                  sigma * np.sqrt(dt) * shocks.diffusion[t - 1])
+            final_prices[..., t] = baseline * multiplier * jump_sizes[t - 1]
 
             # Update user state.
-            for user in self.user_pool.users:
-                user.step(
-                    phase='PostTGE',
-                    current_price=final_prices[t],
-                    baseline_price=baseline,
-                    postTGE_rewards_policy=self.postTGE_rewards_policy
-                )
-            active_users = sum(1 for user in self.user_pool.users if user.active)
-            active_fraction_history[t] = active_users / len(self.user_pool.users)
-            
-        return {
+            active_users = user_state.step_postTGE(
+                current_price=final_prices[..., t],
+                baseline_price=baseline,
+                postTGE_rewards_policy=self.postTGE_rewards_policy,
+                **({} if dt == 1 else {'dt': dt})
+            )
+            active_fraction_history[..., t] = active_users / self.user_pool.num_users
+
+            if self.checkpoint_dir is not None and t % checkpoint_steps == 0 and t < num_steps - 1:
+                arrays = {'post/prices': final_prices, 'post/active_fraction': active_fraction_history}
+                arrays.update({f'shocks/{name}': getattr(shocks, name) for name in PriceShocks.FIELDS})
+                if replicates > 1:
+                    arrays.update({f'replicates/{name}': values
+                                   for name, values in user_state.checkpoint_arrays().items()})
+                self._write_checkpoint('postTGE', t, arrays, {'step': t, 'shock_group_size': shocks.group_size})
+
+        results = {
             "months": months,
             "dynamic_prices": final_prices,
             "active_fraction_history": active_fraction_history,
             "total_unlocked_history": total_unlocked_history,
             "unlocked_history": unlocked_history
         }
+        if replicates > 1:
+            results["variance_reduction_factor"] = shocks.variance_reduction_factor(final_prices[:, -1])
+        return results
+
+    def percentile_bands(self, paths):
+        """
+        {percentile: path} over the replicates (rows) of `paths`, for each of PERCENTILES.
+        """
+        return dict(zip(PERCENTILES, np.percentile(paths, PERCENTILES, axis=0)))
 
-    def run(self):
-        print("=== Running Pre-TGE Simulation ===")
-        self.simulate_preTGE()
-        print("Pre-TGE simulation complete.")
+    def baseline_price_curve(self, total_unlocked):
+        """
+        Vesting-based baseline price for each entry of `total_unlocked` (total unlocked
+        tokens per month, month 0 first). Tokens unlocked after TGE add to the circulating
+        supply, and buybacks remove `buyback_rate` of them from the effective supply.
+        """
+        TGE_total = self.airdrop_allocation_fraction * self.total_supply
+        unlocked_since_TGE = np.asarray(total_unlocked) - total_unlocked[0]
+        circulating_supply = TGE_total + unlocked_since_TGE
+        effective_supply = TGE_total + unlocked_since_TGE * (1 - self.buyback_rate)
+        combined_supply = 0.5 * (circulating_supply + effective_supply)
+        return self.initial_price * (TGE_total / combined_supply) ** self.elasticity
 
-        print("=== Running TGE Simulation ===")
-        self.simulate_TGE()
-        print("TGE simulation complete.")
+    def simulate_TGE_stage(self):
+        """
+        Fused TGE stage: normalize the pre-TGE points, convert them to tokens, rescale
+        the tokens to the airdrop allocation and bucket them by segment, with one
+        conversion pass and one rescale pass over the users.
 
-        raw_TGE_total = sum(user.tokens for user in self.user_pool.users)
+        Returns a dict with:
+          - scaled_TGE_total: tokens allocated to the airdrop,
+          - distribution: % of scaled_TGE_total per segment,
+          - segment_tokens: tokens per segment,
+          - segment_counts: users per segment.
+        """
         scaled_TGE_total = self.airdrop_allocation_fraction * self.total_supply
-        if raw_TGE_total > 0:
-            for user in self.user_pool.users:
-                user.tokens *= (scaled_TGE_total / raw_TGE_total)
+        if self._cohorts is not None:
+            # Totals are computed per cohort, weighted by cohort size.
+            self.simulate_TGE()
+            cohorts = self._cohorts
+            raw_tokens = np.bincount(cohorts.user_size, weights=cohorts.tokens * cohorts.counts,
+                                     minlength=len(SEGMENTS))
+            counts = np.bincount(cohorts.user_size, weights=cohorts.counts, minlength=len(SEGMENTS)).astype(np.int64)
+            raw_TGE_total = raw_tokens.sum()
+        else:
+            max_points = self.user_pool.max_airdrop_points() or 1
+            raw_TGE_total, raw_tokens, counts = self.user_pool.convert_tokens(max_points)
+        scale = scaled_TGE_total / raw_TGE_total if raw_TGE_total > 0 else 0.0
+        self.user_pool.scale_tokens(scale)
+        if self._cohorts is not None:
+            self._cohorts.tokens *= scale
+        segment_tokens = raw_tokens * scale
+        shares = segment_tokens / scaled_TGE_total * 100.0 if scaled_TGE_total > 0 else segment_tokens
+        return {
+            "scaled_TGE_total": scaled_TGE_total,
+            "distribution": {segment: shares[code] for code, segment in enumerate(SEGMENTS)},
+            "segment_tokens": {segment: segment_tokens[code] for code, segment in enumerate(SEGMENTS)},
+            "segment_counts": {segment: int(counts[code]) for code, segment in enumerate(SEGMENTS)}
+        }
+
+    def _write_checkpoint(self, stage, step=None, arrays=None, state=None):
+        """
+        Checkpoint the pool columns, cohorts, random streams and TGE results, plus the
+        stage's own `arrays` and `state`, to checkpoint_dir (no-op without one).
+        """
+        if self.checkpoint_dir is None:
+            return
+        all_arrays = {f'pool/{name}': column for name, column in self.user_pool.checkpoint_arrays().items()}
+        if self._cohorts is not None:
+            all_arrays.update({f'cohorts/{name}': getattr(self._cohorts, name) for name in COHORT_ARRAYS})
+        all_arrays.update(arrays or {})
+        all_state = {'stage': stage, 'rng': generator_states(self.streams), 'pool': self.user_pool.checkpoint_state(),
+                     'cohorts': self._cohorts is not None, 'tge': self._tge}
+        all_state.update(state or {})
+        path = os.path.join(self.checkpoint_dir, checkpoint_name(stage, step))
+        write_checkpoint(path, all_arrays, all_state)
+        prune_checkpoints(self.checkpoint_dir, path)
+
+    def _restore_checkpoint(self):
+        """
+        Restore the state saved in the latest checkpoint of checkpoint_dir and return its
+        (arrays, state), or None if there is none. The caller closes `arrays`.
+        """
+        path = latest_checkpoint(self.checkpoint_dir) if self.checkpoint_dir is not None else None
+        if path is None:
+            return None
+        print(f"Resuming from checkpoint {path}")
+        arrays, state = read_checkpoint(path)
+        self.user_pool.restore_checkpoint({name: arrays[f'pool/{name}'] for name in self.user_pool.COLUMNS},
+                                          state['pool'])
+        restore_generator_states(self.streams, state['rng'])
+        if state['cohorts']:
+            # Cohorts are normally built from a pool; here their arrays are set directly.
+            self._cohorts = Cohorts.__new__(Cohorts)
+            for name in COHORT_ARRAYS:
+                setattr(self._cohorts, name, np.array(arrays[f'cohorts/{name}']))
         else:
-            for user in self.user_pool.users:
-                user.tokens = 0
-        print(f"TGE tokens assigned (scaled to {self.airdrop_allocation_fraction*100:.0f}%): {scaled_TGE_total:.2f}")
-
-        distribution = {"small": 0.0, "medium": 0.0, "large": 0.0, "sybil": 0.0}
-        for u in self.user_pool.users:
-            if isinstance(u, SybilUser):
-                distribution["sybil"] += u.tokens
-            elif isinstance(u, RegularUser):
-                if u.user_size == 'small':
-                    distribution["small"] += u.tokens
-                elif u.user_size == 'medium':
-                    distribution["medium"] += u.tokens
-                elif u.user_size == 'large':
-                    distribution["large"] += u.tokens
-        if scaled_TGE_total > 0:
-            for k in distribution:
-                distribution[k] = (distribution[k] / scaled_TGE_total) * 100.0
-
-        print("=== Running Post-TGE Simulation (Dynamic Price Evolution) ===")
-        postTGE_results = self.simulate_postTGE()
-        print("Post-TGE simulation complete.")
+            self._cohorts = None
+        self._tge = state['tge']
+        return arrays, state
+
+    def run(self, resume=False):
+        """
+        Run pre-TGE, TGE and post-TGE and return the combined results.
+
+        With checkpoint_dir set, checkpoints are written after pre-TGE, after TGE and every
+        checkpoint_every post-TGE months; only the latest post-TGE one is kept. With
+        resume=True the run continues from the latest checkpoint in checkpoint_dir (or
+        starts over if there is none). The simulation must be constructed with the same
+        arguments as the interrupted one; a resumed run gives the same results.
+
+        The worker processes of a sharded pool are shut down when run() returns (or
+        fails); its final columns are gathered first, so user_pool.gather() still works.
+        """
+        checkpoint = self._restore_checkpoint() if resume else None
+        stage = checkpoint[1]['stage'] if checkpoint is not None else None
+        try:
+            if stage is None:
+                print("=== Running Pre-TGE Simulation ===")
+                self.simulate_preTGE(normalize=False)
+                print("Pre-TGE simulation complete.")
+                self._tge = None
+                self._write_checkpoint('preTGE')
+
+            if stage in (None, 'preTGE'):
+                print("=== Running TGE Simulation ===")
+                self._tge = self.simulate_TGE_stage()
+                print("TGE simulation complete.")
+                self._write_checkpoint('TGE')
+            tge = self._tge
+            scaled_TGE_total = tge["scaled_TGE_total"]
+            print(f"TGE tokens assigned (scaled to {self.airdrop_allocation_fraction*100:.0f}%): {scaled_TGE_total:.2f}")
 
+            print("=== Running Post-TGE Simulation (Dynamic Price Evolution) ===")
+            postTGE_results = self.simulate_postTGE(resume=checkpoint if stage == 'postTGE' else None)
+            print("Post-TGE simulation complete.")
+        finally:
+            if checkpoint is not None:
+                checkpoint[0].close()
+            if isinstance(self.user_pool, ShardedUserPool):
+                self.user_pool.close(keep_columns=ColumnarUserPool.COLUMNS)
+        return self.combine_results(tge, postTGE_results)
+
+    def close(self):
+        """
+        Release the user pool's resources (shard worker processes, backing files), if it has any.
+        """
+        if hasattr(self.user_pool, 'close'):
+            self.user_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def combine_results(self, tge, postTGE_results):
+        """
+        The run() results dict from the outputs of simulate_TGE_stage and simulate_postTGE.
+        """
+        scaled_TGE_total = tge["scaled_TGE_total"]
+        prices = postTGE_results["dynamic_prices"]
+        active_fraction = postTGE_results["active_fraction_history"]
         results = {
             "scaled_TGE_total": scaled_TGE_total,
             "months": postTGE_results["months"],
-            "dynamic_prices": postTGE_results["dynamic_prices"],
-            "active_fraction_history": postTGE_results["active_fraction_history"],
+            "dynamic_prices": prices,
+            "active_fraction_history": active_fraction,
             "total_unlocked_history": postTGE_results["total_unlocked_history"],
             "unlocked_history": postTGE_results["unlocked_history"],
-            "distribution": distribution
+            "distribution": tge["distribution"],
+            "segment_tokens": tge["segment_tokens"],
+            "segment_counts": tge["segment_counts"]
         }
+        if self.replicates > 1:
+            # Summaries keep the single-path shapes; the full paths are kept alongside.
+            results.update({
+                "dynamic_prices": np.median(prices, axis=0),
+                "active_fraction_history": active_fraction.mean(axis=0),
+                "price_paths": prices,
+                "active_fraction_paths": active_fraction,
+                "price_bands": self.percentile_bands(prices),
+                "active_fraction_bands": self.percentile_bands(active_fraction),
+                "variance_reduction_factor": postTGE_results["variance_reduction_factor"]
+            })
         return results
 
 if __name__ == '__main__':
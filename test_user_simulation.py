@@ -1,7 +1,29 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+import tracemalloc
 import unittest
+from unittest import mock
 import numpy as np
-from users import RegularUser, SybilUser
-from user_pool import UserPool
+from users import RegularUser, SybilUser, accrue_airdrop_points
+from user_pool import UserPool, ColumnarUserPool, segment_counts, EFFECTIVE_WEIGHTS_RECOMPUTE_INTERVAL
+from airdrop_policy import (AirdropPolicy, LinearAirdropPolicy, ExponentialAirdropPolicy, TieredConstantAirdropPolicy,
+                            TieredLinearAirdropPolicy, TieredExponentialAirdropPolicy)
+from postTGE_rewards_policy import GenericPostTGERewardPolicy
+from sharded_pool import ShardedUserPool
+from simulation import MonteCarloSimulation
+from vesting import PostTGERewardsManager, VestingLedger, VestingSchedule
+from chunked_pool import ChunkedUserPool
+from random_streams import RandomStreams, price_shocks
+from adaptive import run_adaptive, shared_populations, t_quantile
+from pipeline import run_staged
+from checkpoint import latest_checkpoint
+from results_store import ResultsStore
+from shared_population import SharedPopulation
+from activity_stats import ActivityStats, generate_stats, generate_stats_batch, required_fields, stats_row, STAT_FIELDS
+from preTGE_rewards import (PreTGERewardsPolicy, DydxRetroTieredRewardPolicy, VertexMakerTakerRewardPolicy,
+                            JupiterVolumeTierRewardPolicy, AevoFarmBoostRewardPolicy, GenericPreTGERewardPolicy)
 
 class TestUserSimulation(unittest.TestCase):
 
@@ -45,6 +67,413 @@ class TestUserSimulation(unittest.TestCase):
         self.assertTrue(250 < num_sybil < 350,
                         "Sybil percentage should be around 30% of total users.")
 
+    def test_columnar_user_pool_views(self):
+        pool = ColumnarUserPool(num_users=1000)
+        self.assertEqual(len(pool.users), 1000)
+        num_sybil = sum(isinstance(u, SybilUser) for u in pool.users)
+        self.assertEqual(num_sybil, int(pool.is_sybil.sum()))
+        self.assertTrue(250 < num_sybil < 350)
+        user = next(u for u in pool.users if isinstance(u, RegularUser))
+        user.airdrop_points = 10
+        user.step('TGE')
+        self.assertEqual(pool.tokens[user._index], 10,
+                         "Views should write through to the pool columns.")
+
+    def test_closed_form_preTGE_matches_stepping(self):
+        rates = np.array([0, 1, 2, 3, 5, 9], dtype=float)
+        endowments = np.array([1.1, 0.1, 3.1, 2.1, 5.1, 7.1])
+        decay = np.full(6, 0.1)
+        for n_steps in (1, 2, 5, 50):
+            points = np.zeros(6)
+            for _ in range(n_steps):
+                points = np.maximum(points + (rates * (endowments - points) - decay * points), 0)
+            closed = accrue_airdrop_points(np.zeros(6), rates, endowments, decay, n_steps)
+            np.testing.assert_allclose(closed, points, rtol=1e-9, atol=1e-12)
+            # Scalars take the diverging and negative-b branches too.
+            for i in (2, 4):
+                scalar = accrue_airdrop_points(0.0, rates[i], endowments[i], decay[i], n_steps)
+                self.assertEqual(np.shape(scalar), ())
+                self.assertAlmostEqual(float(scalar), points[i], delta=1e-9 * max(1, abs(points[i])))
+            self.assertEqual(float(accrue_airdrop_points(5.0, 0.5, -1.0, 0.1, n_steps)),
+                             float(accrue_airdrop_points(np.array([5.0]), 0.5, -1.0, 0.1, n_steps)[0]))
+
+    def test_accrue_preTGE_falls_back_for_custom_step(self):
+        class CountingUser(RegularUser):
+            def step(self, phase, **kwargs):
+                self.airdrop_points += 1
+
+        pool = UserPool(num_users=10)
+        pool.users.append(CountingUser(wealth=1000, user_id=10, user_size='small'))
+        pool.accrue_preTGE(7)
+        self.assertEqual(pool.users[-1].airdrop_points, 7)
+
+    def test_columnar_postTGE_step(self):
+        pool = ColumnarUserPool(num_users=1000)
+        pool.tokens[:] = 1.0
+        num_active = pool.step_postTGE(current_price=10.0, baseline_price=10.0,
+                                       postTGE_rewards_policy=GenericPostTGERewardPolicy())
+        self.assertEqual(num_active, int(pool.active.sum()))
+        self.assertFalse(pool.active[pool.is_sybil].any(), "Sybils should exit in bulk post-TGE.")
+        np.testing.assert_array_equal(pool.active_days, pool.active.astype(int))
+        self.assertTrue(np.all(pool.tokens[pool.active] > 1.0))
+        self.assertTrue(np.all(pool.tokens[~pool.active] == 1.0))
+
+    def test_user_pool_segment_mix(self):
+        size_mix = {'small': 0.5, 'medium': 0.5, 'large': 0.0}
+        for pool_cls in (UserPool, ColumnarUserPool):
+            pool = pool_cls(num_users=1000, sybil_fraction=0.1, size_mix=size_mix)
+            sizes = [getattr(u, 'user_size', 'sybil') for u in pool.users]
+            self.assertEqual(sizes.count('sybil'), 100)
+            self.assertEqual(sizes.count('small'), 450)
+            self.assertEqual(sizes.count('large'), 0)
+            self.assertEqual(sorted(u.user_id for u in pool.users), list(range(1000)))
+
+    def test_cohorts_cover_pool(self):
+        pool = ColumnarUserPool(num_users=2000)
+
+        def no_full_sort(function):
+            def wrapper(a, *args, **kwargs):
+                self.assertLess(np.size(a), pool.num_users, f"{function.__name__} over the whole pool")
+                return function(a, *args, **kwargs)
+            return wrapper
+        # Generated populations are grouped without sorting the pool's columns.
+        with mock.patch.multiple(np, unique=no_full_sort(np.unique), sort=no_full_sort(np.sort),
+                                 argsort=no_full_sort(np.argsort)):
+            cohorts = pool.cohorts()
+        self.assertLess(len(cohorts), 2000)
+        self.assertEqual(cohorts.counts.sum(), 2000)
+        np.testing.assert_array_equal(cohorts.endowment[cohorts.inverse], pool.endowment)
+        np.testing.assert_array_equal(cohorts.user_size[cohorts.inverse], pool.user_size)
+        np.testing.assert_array_equal(cohorts.inverse[cohorts.first], np.arange(len(cohorts)))
+        # Arbitrary values fall back to factorizing the columns.
+        pool.airdrop_points[:] = np.random.default_rng(0).random(2000).round(2)
+        cohorts = pool.cohorts()
+        np.testing.assert_array_equal(cohorts.airdrop_points[cohorts.inverse], pool.airdrop_points)
+
+    def test_sharded_pool_reductions(self):
+        with ShardedUserPool(num_users=1000, num_shards=2, seed=7) as pool:
+            self.assertEqual(sum(pool.shard_sizes), 1000)
+            pool.accrue_preTGE(5)
+            pool.normalize_airdrop_points(pool.max_airdrop_points() or 1)
+            pool.step_all('TGE')
+            self.assertAlmostEqual(pool.total_tokens(), pool.gather('tokens').sum())
+            self.assertAlmostEqual(sum(pool.segment_tokens().values()), pool.total_tokens())
+            num_active = pool.step_postTGE(current_price=1.0, baseline_price=1.0)
+            self.assertEqual(num_active, pool.gather('active').sum())
+
+    def test_chunked_pool_streams_like_columnar(self):
+        pool = ChunkedUserPool(num_users=1000, memory_budget=64 * 1024)
+        try:
+            self.assertLess(pool.chunk_size, 1000)
+            self.assertEqual(len(pool.users), 1000)
+            self.assertEqual(sorted(pool.user_id), list(range(1000)))
+            pool.accrue_preTGE(10)
+            max_points = pool.max_airdrop_points()
+            self.assertEqual(max_points, pool.airdrop_points.max())
+            pool.normalize_airdrop_points(max_points)
+            self.assertAlmostEqual(pool.airdrop_points.max(), 1.0)
+            num_active = pool.step_postTGE(current_price=1.0, baseline_price=1.0)
+            self.assertEqual(num_active, pool.active.sum())
+        finally:
+            pool.close()
+        # The segment mix does not depend on the chunk size.
+        pool = ChunkedUserPool(num_users=5000, memory_budget=2000)
+        try:
+            self.assertLess(pool.chunk_size, 10)
+            self.assertEqual(list(np.bincount(pool.user_size)), segment_counts(5000))
+        finally:
+            pool.close()
+
+    def test_sharded_run_shuts_down_workers(self):
+        simulation = MonteCarloSimulation(num_users=400, preTGE_steps=5, simulation_horizon=3, num_shards=2, rng=1)
+        results = simulation.run()
+        self.assertEqual(multiprocessing.active_children(), [])
+        # The final columns stay available for inspection.
+        self.assertEqual(len(simulation.user_pool.gather('tokens')), 400)
+        self.assertEqual(simulation.user_pool.gather('active').sum() / 400, results['active_fraction_history'][-1])
+        with self.assertRaises(RuntimeError):
+            simulation.user_pool.total_tokens()
+        with MonteCarloSimulation(num_users=400, num_shards=2, rng=1) as unused:
+            self.assertEqual(len(multiprocessing.active_children()), 2)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_generate_stats_batch(self):
+        user_size = np.array([0, 1, 2, 3, 2], dtype=np.int8)
+        endowment = np.array([1.1, 2.1, 3.1, 4.0, 0.1])
+        stats = generate_stats_batch(user_size, endowment)
+        self.assertEqual(set(stats), set(STAT_FIELDS))
+        np.testing.assert_allclose(stats['trading_volume'], endowment * [50, 150, 300, 100, 300])
+        regular = user_size != 3
+        np.testing.assert_allclose((stats['maker_volume'] + stats['taker_volume'])[regular],
+                                   stats['trading_volume'][regular])
+        self.assertEqual(stats['swap_volume'][3], 0, "Sybil rows only carry trading_volume.")
+        self.assertEqual(set(generate_stats(SybilUser(wealth=1, user_id=0))), {'trading_volume'})
+        # Per-user stats follow the user's seeded Generator.
+        users = [RegularUser(wealth=1000, user_id=0, user_size='medium', rng=5) for _ in range(2)]
+        self.assertEqual(generate_stats(users[0]), generate_stats(users[1]))
+
+    def test_activity_stats_lazy_and_stable_per_field(self):
+        user_size = np.array([0, 1, 2, 3] * 25, dtype=np.int8)
+        endowment = np.linspace(0.1, 10, 100)
+        full = generate_stats_batch(user_size, endowment, seed=42)
+        partial = generate_stats_batch(user_size, endowment, fields=('swap_volume',), seed=42)
+        self.assertEqual(set(partial), {'swap_volume'})
+        np.testing.assert_array_equal(partial['swap_volume'], full['swap_volume'])
+        stats = ActivityStats(user_size, endowment, seed=42)
+        stats['trading_volume']
+        self.assertEqual(set(stats._columns), {'trading_volume'}, "Stats should be generated on demand.")
+        self.assertEqual(JupiterVolumeTierRewardPolicy().required_stats, ('swap_volume',))
+
+    def test_calculate_points_batch_matches_scalar(self):
+        user_size = np.array([0, 1, 2, 3] * 50, dtype=np.int8)
+        endowment = np.geomspace(0.1, 50000, 200)
+        stats = ActivityStats(user_size, endowment, seed=7)
+
+        class ScalarOnlyPolicy(PreTGERewardsPolicy):
+            def calculate_points(self, activity_stats, user):
+                return activity_stats.get('swap_volume', 5.0)
+
+        for policy in (DydxRetroTieredRewardPolicy(), VertexMakerTakerRewardPolicy(), JupiterVolumeTierRewardPolicy(),
+                       AevoFarmBoostRewardPolicy(), GenericPreTGERewardPolicy(), ScalarOnlyPolicy()):
+            fields = required_fields(policy)
+            expected = [policy.calculate_points(stats_row(stats, i, code, fields), None)
+                        for i, code in enumerate(user_size)]
+            np.testing.assert_allclose(policy.calculate_points_batch(stats), expected, rtol=1e-12,
+                                       err_msg=type(policy).__name__)
+
+    def test_calculate_tokens_batch_matches_scalar(self):
+        points = np.concatenate((np.linspace(0, 1, 101), [0.2, 0.6]))
+
+        class ScalarOnlyPolicy(AirdropPolicy):
+            def calculate_tokens(self, airdrop_points, user):
+                return 3 * airdrop_points
+
+        for policy in (AirdropPolicy(), LinearAirdropPolicy(2.0), ExponentialAirdropPolicy(), TieredConstantAirdropPolicy(),
+                       TieredLinearAirdropPolicy(), TieredExponentialAirdropPolicy(),
+                       TieredLinearAirdropPolicy([(0.3, 1.0), (0.5, 2.0)]), ScalarOnlyPolicy()):
+            expected = [policy.calculate_tokens(p, None) for p in points]
+            np.testing.assert_allclose(policy.calculate_tokens_batch(points), expected, rtol=1e-12,
+                                       err_msg=type(policy).__name__)
+
+    def test_fused_TGE_stage(self):
+        for kwargs in ({}, {'columnar': True}, {'columnar': True, 'cohort_compression': True}):
+            sim = MonteCarloSimulation(num_users=500, preTGE_steps=10, total_supply=1000, **kwargs)
+            sim.simulate_preTGE(normalize=False)
+            tge = sim.simulate_TGE_stage()
+            self.assertAlmostEqual(sum(tge['distribution'].values()), 100.0)
+            self.assertAlmostEqual(sim.user_pool.total_tokens(), tge['scaled_TGE_total'])
+            self.assertEqual(sum(tge['segment_counts'].values()), 500)
+            self.assertAlmostEqual(tge['segment_tokens']['sybil'], sim.user_pool.segment_tokens()['sybil'])
+            self.assertAlmostEqual(sim.user_pool.max_airdrop_points(), 1.0)
+
+    def test_unlock_matrix_matches_schedules(self):
+        manager = PostTGERewardsManager(total_supply=1000)
+        matrix = manager.unlock_matrix(61)
+        for month in (0, 1, 12, 30, 48, 60):
+            np.testing.assert_allclose(matrix[:, month], list(manager.get_unlocked_allocations(month).values()))
+        self.assertIs(PostTGERewardsManager(total_supply=1000).unlock_matrix(61), matrix,
+                      "Identical vesting should reuse the cached matrix.")
+        self.assertFalse(matrix.flags.writeable)
+
+    def test_vesting_ledger(self):
+        manager = PostTGERewardsManager(total_supply=1000)
+        ledger = VestingLedger.from_manager(manager)
+        np.testing.assert_allclose(ledger.unlock_matrix(61), manager.unlock_matrix(61))
+        np.testing.assert_allclose(ledger.unlocked_tokens(13.5),
+                                   [s.get_unlocked_tokens(13.5) for s in manager.schedules.values()])
+
+        grants = ledger.add_grants([100.0, 200.0], unlock_at_tge=0.1, lockup_duration=[0, 12],
+                                   initial_cliff_unlock=0.2, unlock_duration=24, group='Grants')
+        self.assertEqual(list(grants), [8, 9])
+        months = np.array([-1, 0, 6, 12, 24, 36, 48])
+        expected = sum(VestingSchedule(a, 0.1, lockup, 0.2, 24).get_unlocked_tokens(months)
+                       for a, lockup in ((100.0, 0), (200.0, 12)))
+        np.testing.assert_allclose(ledger.unlocked_by_group(months)[ledger.groups.index('Grants')], expected)
+
+    def test_sub_monthly_postTGE_steps(self):
+        pool = ColumnarUserPool(num_users=2000)
+        pool.tokens[:] = 1.0
+        policy = GenericPostTGERewardPolicy()
+        pool.step_postTGE(current_price=1.0, baseline_price=1.0, postTGE_rewards_policy=policy)
+        before = pool.active.copy()
+        pool.step_postTGE(current_price=1.0, baseline_price=1.0, postTGE_rewards_policy=policy, dt=0.1)
+        self.assertFalse(pool.active[pool.is_sybil].any())
+        # Only about a tenth of the users redraw their activity in a 0.1-month step.
+        self.assertGreater(np.mean(pool.active == before), 0.8)
+        self.assertLessEqual(set(np.round(pool.active_days[pool.active], 9)), {0.1, 1.1})
+
+        sim = MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=2, postTGE_dt=0.25,
+                                   columnar=True)
+        results = sim.run()
+        np.testing.assert_allclose(results['months'], np.arange(9) * 0.25)
+        self.assertEqual(len(results['dynamic_prices']), 9)
+        self.assertEqual(len(results['unlocked_history']['Team']), 9)
+
+    def test_incremental_effective_weights(self):
+        pool = ColumnarUserPool(num_users=3000)
+        pool.tokens[:] = np.random.rand(pool.num_users) * 100
+        policy = GenericPostTGERewardPolicy()
+        pool.effective_weights(1.0)
+        # Across several recompute intervals, the maintained sums match a full recomputation.
+        for step in range(2 * EFFECTIVE_WEIGHTS_RECOMPUTE_INTERVAL + 3):
+            num_active = pool.step_postTGE(current_price=1.1, baseline_price=1.0, postTGE_rewards_policy=policy,
+                                           dt=0.5 if step % 2 else 1)
+            self.assertEqual(num_active, pool.active.sum())
+            eff = pool.tokens * (1 + 0.1 * pool.active_days) + 1.0 * pool.endowment
+            np.testing.assert_allclose(pool.effective_weights(1.0), (eff.sum(), eff[pool.active].sum()), rtol=1e-12)
+
+    def test_replicated_postTGE_paths(self):
+        sim = MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=3, columnar=True, replicates=4)
+        results = sim.run()
+        self.assertEqual(results['price_paths'].shape, (4, 4))
+        self.assertEqual(results['active_fraction_paths'].shape, (4, 4))
+        self.assertEqual(len(results['dynamic_prices']), 4)
+        self.assertEqual(sorted(results['price_bands']), [5, 25, 50, 75, 95])
+        self.assertTrue(np.all(results['price_bands'][5] <= results['price_bands'][95]))
+        with self.assertRaises(ValueError):
+            MonteCarloSimulation(num_users=10, replicates=2)
+
+    def test_seeded_runs_are_reproducible(self):
+        for kwargs in ({}, {'columnar': True}, {'columnar': True, 'postTGE_dt': 0.5}):
+            runs = [MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=4, rng=seed, **kwargs).run()
+                    for seed in (11, 11, 12)]
+            np.testing.assert_array_equal(runs[0]['dynamic_prices'], runs[1]['dynamic_prices'])
+            np.testing.assert_array_equal(runs[0]['active_fraction_history'], runs[1]['active_fraction_history'])
+            self.assertFalse(np.array_equal(runs[0]['dynamic_prices'], runs[2]['dynamic_prices']))
+
+    def test_common_random_numbers(self):
+        sims = [MonteCarloSimulation(num_users=400, preTGE_steps=5, simulation_horizon=3, columnar=True,
+                                     airdrop_policy=policy, rng=RandomStreams(5))
+                for policy in (LinearAirdropPolicy(), ExponentialAirdropPolicy())]
+        self.assertTrue(np.array_equal(sims[0].user_pool.wealth, sims[1].user_pool.wealth))
+        for sim in sims:
+            sim.simulate_preTGE()
+        np.testing.assert_array_equal(sims[0].user_pool.airdrop_points, sims[1].user_pool.airdrop_points)
+        # A stream's draws do not depend on how much the others consumed.
+        streams = RandomStreams(5)
+        streams.retention.random(1000)
+        self.assertEqual(streams.price.random(), RandomStreams(5).price.random())
+
+    def test_variance_reduction_shock_schemes(self):
+        rng = np.random.default_rng(3)
+        shocks = price_shocks(rng, 12, 6, 'antithetic')
+        np.testing.assert_array_equal(shocks.diffusion[:, ::2], -shocks.diffusion[:, 1::2])
+        np.testing.assert_array_equal(shocks.jump_uniform[:, ::2], 1 - shocks.jump_uniform[:, 1::2])
+        sobol = price_shocks(rng, 12, 64, 'sobol')
+        self.assertEqual(sobol.diffusion.shape, (12, 64))
+        self.assertTrue(np.all((sobol.jump_uniform > 0) & (sobol.jump_uniform < 1)))
+        with self.assertRaises(ValueError):
+            price_shocks(rng, 12, None, 'antithetic')
+        results = MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=6, columnar=True,
+                                       replicates=16, shock_scheme='antithetic', rng=1).run()
+        self.assertGreater(results['variance_reduction_factor'], 0)
+
+    def test_adaptive_runs_stop_on_interval_width(self):
+        self.assertAlmostEqual(t_quantile(0.975, 10), 2.228, places=2)
+        make_simulation = lambda rng: MonteCarloSimulation(num_users=200, preTGE_steps=5, simulation_horizon=3,
+                                                           columnar=True, rng=rng)
+        loose = run_adaptive(make_simulation, rel_width=10.0, min_runs=3, max_runs=6, seed=1)
+        self.assertTrue(loose['converged'])
+        self.assertEqual(loose['runs'], 3)
+        tight = run_adaptive(make_simulation, rel_width=1e-9, min_runs=3, max_runs=5, seed=1)
+        self.assertFalse(tight['converged'])
+        self.assertEqual(tight['runs'], 5)
+        np.testing.assert_array_equal(tight['samples']['final_price'][:3], loose['samples']['final_price'])
+
+    def test_staged_pipeline_matches_full_runs(self):
+        make_simulation = lambda rng, **kwargs: MonteCarloSimulation(num_users=400, preTGE_steps=5,
+                                                                     simulation_horizon=6, rng=rng, **kwargs)
+        variants = [('calm', {'sigma': 0.0, 'jump_intensity': 0.0}),
+                    ('volatile', {'sigma': 0.3, 'jump_intensity': 0.5, 'buyback_rate': 0.4})]
+        results, TGE_tokens = run_staged(make_simulation, [('dydx', DydxRetroTieredRewardPolicy())],
+                                         [('linear', LinearAirdropPolicy()), ('tiered', TieredLinearAirdropPolicy())],
+                                         variants, rng=4)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(TGE_tokens[('dydx', 'tiered')]), 400)
+        full = make_simulation(4, preTGE_rewards_policy=DydxRetroTieredRewardPolicy(),
+                               airdrop_policy=TieredLinearAirdropPolicy(), **variants[1][1]).run()
+        np.testing.assert_allclose(results[('dydx', 'tiered', 'volatile')]['dynamic_prices'], full['dynamic_prices'])
+        self.assertNotEqual(list(results[('dydx', 'tiered', 'calm')]['dynamic_prices']), list(full['dynamic_prices']))
+
+    def test_checkpoint_resume_matches_uninterrupted_run(self):
+        make_simulation = lambda checkpoint_dir: MonteCarloSimulation(
+            num_users=300, preTGE_steps=5, simulation_horizon=6, columnar=True, replicates=2, rng=9,
+            checkpoint_dir=checkpoint_dir, checkpoint_every=2)
+        full = make_simulation(None).run()
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            make_simulation(checkpoint_dir).run()
+            self.assertTrue(os.path.basename(latest_checkpoint(checkpoint_dir)).startswith('checkpoint-2-postTGE'))
+            self.assertEqual(len(os.listdir(checkpoint_dir)), 3)
+            resumed = make_simulation(checkpoint_dir).run(resume=True)
+        np.testing.assert_allclose(resumed['price_paths'], full['price_paths'])
+        np.testing.assert_allclose(resumed['active_fraction_paths'], full['active_fraction_paths'])
+        with self.assertRaises(ValueError):
+            MonteCarloSimulation(num_users=10, checkpoint_dir='unused')
+
+    def test_chunked_resume_stays_within_memory_budget(self):
+        num_users = 10000
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            make_simulation = lambda: MonteCarloSimulation(num_users=num_users, preTGE_steps=5, simulation_horizon=4,
+                                                           memory_budget=256 * 1024, rng=3,
+                                                           checkpoint_dir=checkpoint_dir, checkpoint_every=2)
+            full = make_simulation().run()
+            simulation = make_simulation()
+            tracemalloc.start()
+            try:
+                arrays, _ = simulation._restore_checkpoint()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            # Columns are streamed into the chunks, never loaded whole.
+            self.assertLess(peak, num_users * 8)
+            arrays.close()
+            resumed = make_simulation().run(resume=True)
+            simulation.close()
+        np.testing.assert_allclose(resumed['dynamic_prices'], full['dynamic_prices'])
+
+    def test_results_store_round_trip(self):
+        results = MonteCarloSimulation(num_users=200, preTGE_steps=5, simulation_horizon=6, columnar=True, rng=3).run()
+        with tempfile.TemporaryDirectory() as results_dir:
+            handle = ResultsStore(results_dir).write("dYdX Retro + Linear/Tiered", results)
+            store = ResultsStore(results_dir)
+            self.assertEqual(list(store), ["dYdX Retro + Linear/Tiered"])
+            stored = handle.load()
+            self.assertIsInstance(stored["dynamic_prices"], np.memmap)
+            np.testing.assert_array_equal(stored["dynamic_prices"], results["dynamic_prices"])
+            np.testing.assert_array_equal(stored["unlocked_history"]["Team"], results["unlocked_history"]["Team"])
+            self.assertEqual(stored["segment_counts"], results["segment_counts"])
+            self.assertNotIn("missing", store)
+            store.clear()
+            self.assertEqual(len(store), 0)
+
+    def test_shared_population_matches_drawn_population(self):
+        make_simulation = lambda **kwargs: MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=6,
+                                                                columnar=True, rng=RandomStreams(6), **kwargs)
+        full = make_simulation().run()
+        with SharedPopulation.generate(300, rng=RandomStreams(6).population) as population:
+            attached = pickle.loads(pickle.dumps(population))
+            simulation = make_simulation(population=attached)
+            pool = simulation.user_pool
+            self.assertFalse(pool.wealth.flags.writeable)
+            self.assertIs(simulation.fork().user_pool.wealth, pool.wealth)
+            np.testing.assert_array_equal(simulation.run()['dynamic_prices'], full['dynamic_prices'])
+            del simulation, pool
+            attached.close()
+        # Runs beyond the shared populations draw the same populations themselves.
+        make_adaptive = lambda rng, **kwargs: MonteCarloSimulation(num_users=300, preTGE_steps=5, simulation_horizon=6,
+                                                                    columnar=True, rng=rng, **kwargs)
+        plain = run_adaptive(make_adaptive, min_runs=3, max_runs=3, seed=2, common_random_numbers=True)
+        populations = shared_populations(300, seed=2, runs=1)
+        try:
+            shared = run_adaptive(make_adaptive, min_runs=3, max_runs=3, seed=2, common_random_numbers=True,
+                                  populations=populations)
+            del shared["simulation"]
+        finally:
+            for population in populations:
+                population.close()
+                population.unlink()
+        np.testing.assert_array_equal(shared["samples"]["final_price"], plain["samples"]["final_price"])
+
 if __name__ == '__main__':
     unittest.main(argv=[''], exit=False)
 
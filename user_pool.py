@@ -1,58 +1,745 @@
+import copy
+from collections.abc import Sequence
 import numpy as np
 from airdrop_policy import AirdropPolicy
-from users import RegularUser, SybilUser
+from activity_stats import ActivityStats, size_code
+from random_streams import as_generator, as_streams, draw_seed
+from users import (RegularUser, SybilUser, RegularUserView, SybilUserView, USER_SIZES, SEGMENTS, SYBIL, POISSON_LAM,
+                   RETENTION_BASE, DEFAULT_RETENTION_BASE, accrue_airdrop_points, has_stock_preTGE_step)
+
+# Lognormal (mean, sigma) of user wealth, by segment.
+WEALTH_PARAMS = {'small': (6, 1.5), 'medium': (7, 1.2), 'large': (8, 1.0), 'sybil': (5, 1.0)}
+DEFAULT_SYBIL_FRACTION = 0.3
+DEFAULT_SIZE_MIX = {'small': 0.6, 'medium': 0.3, 'large': 0.1}
+
+def segment_counts(num_users, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None):
+    """
+    Number of users per segment, in SEGMENTS order.
+    `sybil_fraction` is a share of all users; `size_mix` gives each size's share of
+    the regular users, with the last size absorbing rounding.
+    """
+    size_mix = size_mix if size_mix is not None else DEFAULT_SIZE_MIX
+    num_sybil = int(num_users * sybil_fraction)
+    num_regular = num_users - num_sybil
+    counts = [int(num_regular * size_mix.get(size, 0.0)) for size in USER_SIZES[:-1]]
+    counts.append(num_regular - sum(counts))
+    counts.append(num_sybil)
+    return counts
+
+def generate_population(num_users, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None, rng=None, counts=None):
+    """
+    Draw the attributes of a whole population as arrays, one lognormal and two Poisson
+    calls per segment, then shuffle everything with a single permutation index.
+    `rng` is a numpy Generator or seed (see random_streams.as_generator).
+    `counts` (users per segment, in SEGMENTS order) overrides segment_counts, e.g. for
+    one chunk of a larger population.
+
+    Returns a dict of arrays keyed like the ColumnarUserPool columns: user_id,
+    wealth, user_size (SEGMENTS code), interaction_rate and endowment.
+    user_id is the position before shuffling, as with per-object generation.
+    """
+    rng = as_generator(rng)
+    if counts is None:
+        counts = segment_counts(num_users, sybil_fraction, size_mix)
+    wealth = np.concatenate([rng.lognormal(mean=WEALTH_PARAMS[seg][0], sigma=WEALTH_PARAMS[seg][1], size=c)
+                             for seg, c in zip(SEGMENTS, counts)])
+    user_size = np.repeat(np.arange(len(SEGMENTS), dtype=np.int8), counts)
+    lam = np.repeat([POISSON_LAM[seg] for seg in SEGMENTS], counts)
+    interaction_rate = rng.poisson(lam=lam).astype(float)
+    endowment = rng.poisson(lam=lam).astype(float)
+    # Regular users get the initial baseline endowment; sybils do not.
+    endowment[user_size != SYBIL] += 0.1
+
+    # Shuffle so user types are interspersed.
+    order = rng.permutation(num_users)
+    return {
+        'user_id': order.astype(np.int64),
+        'wealth': wealth[order],
+        'user_size': user_size[order],
+        'interaction_rate': interaction_rate[order],
+        'endowment': endowment[order],
+    }
+
+def base_population(num_users, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None, rng=None):
+    """
+    generate_population plus the other columns of a ColumnarUserPool that stay fixed
+    during a run (decay_rate, is_sybil): everything but ColumnarUserPool.MUTABLE_COLUMNS.
+    """
+    population = generate_population(num_users, sybil_fraction, size_mix, rng)
+    population['decay_rate'] = np.full(num_users, 0.1)
+    population['is_sybil'] = population['user_size'] == SYBIL
+    return population
 
 class UserPool:
     """
     Generates and manages a collection of users (both regular and sybil).
+
+    sybil_fraction and size_mix set the segment mix (see segment_counts). `rng` is a
+    numpy Generator or seed shared by every random draw of the pool and its users, or a
+    random_streams.RandomStreams whose population, stats and retention streams are used
+    for those draws (common random numbers across pools).
     """
-    def __init__(self, num_users, airdrop_policy=None):
+    def __init__(self, num_users, airdrop_policy=None, sybil_fraction=DEFAULT_SYBIL_FRACTION, size_mix=None,
+                 rng=None):
         self.num_users = num_users
+        self.streams = as_streams(rng)
         self.airdrop_policy = airdrop_policy if airdrop_policy is not None else AirdropPolicy()
+        self.sybil_fraction = sybil_fraction
+        self.size_mix = size_mix if size_mix is not None else DEFAULT_SIZE_MIX
         self.users = []
         self.generate_users()
 
     def generate_users(self):
-        sybil_percentage = 0.3
-        num_sybil = int(self.num_users * sybil_percentage)
-        num_regular = self.num_users - num_sybil
-
-        small_percentage = 0.6
-        medium_percentage = 0.3
-        large_percentage = 0.1
-        
-        num_small = int(num_regular * small_percentage)
-        num_medium = int(num_regular * medium_percentage)
-        num_large = num_regular - num_small - num_medium
-
-        user_id = 0
-        
-        wealth_small = np.random.lognormal(mean=6, sigma=1.5, size=num_small)
-        wealth_medium = np.random.lognormal(mean=7, sigma=1.2, size=num_medium)
-        wealth_large = np.random.lognormal(mean=8, sigma=1.0, size=num_large)
-
-        for w in wealth_small:
-            self.users.append(RegularUser(w, user_id, 'small', self.airdrop_policy))
-            user_id += 1
-        for w in wealth_medium:
-            self.users.append(RegularUser(w, user_id, 'medium', self.airdrop_policy))
-            user_id += 1
-        for w in wealth_large:
-            self.users.append(RegularUser(w, user_id, 'large', self.airdrop_policy))
-            user_id += 1
-        
-        # Generate wealth for sybil users
-        wealth_sybil = np.random.lognormal(mean=5, sigma=1.0, size=num_sybil)
-        for w in wealth_sybil:
-            self.users.append(SybilUser(w, user_id, self.airdrop_policy))
-            user_id += 1
-
-        # Shuffle the list so user types are interspersed
-        np.random.shuffle(self.users)
+        population = generate_population(self.num_users, self.sybil_fraction, self.size_mix, self.streams.population)
+        self.users = []
+        columns = [population[name].tolist() for name in
+                   ('user_id', 'wealth', 'user_size', 'interaction_rate', 'endowment')]
+        for user_id, wealth, code, rate, endowment in zip(*columns):
+            if code == SYBIL:
+                user = SybilUser(wealth, user_id, self.airdrop_policy,
+                                 interaction_rate=rate, endowment=endowment, rng=self.streams.retention)
+            else:
+                user = RegularUser(wealth, user_id, SEGMENTS[code], self.airdrop_policy,
+                                   interaction_rate=rate, endowment=endowment, rng=self.streams.retention)
+            self.users.append(user)
+
+    def copy(self):
+        """
+        Independent copy of the pool, its users and its random streams, which continue
+        from their current state.
+        """
+        return copy.deepcopy(self)
+
+    def set_airdrop_policy(self, airdrop_policy):
+        self.airdrop_policy = airdrop_policy
+        for user in self.users:
+            user.airdrop_policy = airdrop_policy
 
     def step_all(self, phase):
         for user in self.users:
             user.step(phase)
 
+    def accrue_preTGE(self, n_steps):
+        """
+        Equivalent to calling step_all('PreTGE') `n_steps` times.
+        Users with the stock PreTGE step are advanced in one closed-form vectorized
+        call; users overriding `step` or `update_airdrop_points` are stepped one by one.
+        """
+        stock = [user for user in self.users if has_stock_preTGE_step(user)]
+        if stock:
+            points = accrue_airdrop_points(
+                [u.airdrop_points for u in stock],
+                [u.interaction_rate for u in stock],
+                [u.endowment for u in stock],
+                [u.decay_rate for u in stock],
+                n_steps
+            )
+            for user, p in zip(stock, points):
+                user.airdrop_points = p
+        if len(stock) < len(self.users):
+            custom = [user for user in self.users if not has_stock_preTGE_step(user)]
+            for _ in range(n_steps):
+                for user in custom:
+                    user.step('PreTGE')
+
+    def add_preTGE_rewards(self, preTGE_rewards_policy):
+        """
+        Add each user's pre-TGE reward points, computed from their activity stats.
+        Only the stats declared in the policy's `required_stats` are generated.
+        """
+        stats = ActivityStats([size_code(user) for user in self.users], [user.endowment for user in self.users],
+                              seed=draw_seed(self.streams.stats))
+        points = preTGE_rewards_policy.calculate_points_batch(stats, self.users)
+        for user, user_points in zip(self.users, points):
+            user.airdrop_points += user_points
+
+    def max_airdrop_points(self):
+        return max(user.airdrop_points for user in self.users)
+
+    def normalize_airdrop_points(self, max_points):
+        for user in self.users:
+            user.airdrop_points /= max_points
+
+    def total_tokens(self):
+        return sum(user.tokens for user in self.users)
+
+    def scale_tokens(self, factor):
+        for user in self.users:
+            user.tokens *= factor
+
+    def segment_tokens(self):
+        """
+        Token totals by segment: {'small', 'medium', 'large', 'sybil'}.
+        Regular users with any other user_size are not counted.
+        """
+        totals = {segment: 0.0 for segment in SEGMENTS}
+        for u in self.users:
+            if isinstance(u, SybilUser):
+                totals["sybil"] += u.tokens
+            elif isinstance(u, RegularUser):
+                if u.user_size in totals:
+                    totals[u.user_size] += u.tokens
+        return totals
+
+    def convert_tokens(self, max_points=1):
+        """
+        Fused TGE pass: normalize airdrop_points by `max_points`, run each user's TGE
+        step and accumulate the resulting tokens.
+
+        Returns (total tokens, per-segment token totals, per-segment user counts), the
+        last two as arrays in SEGMENTS order. Regular users with any other user_size
+        only count toward the total.
+        """
+        total = 0.0
+        segment_tokens = np.zeros(len(SEGMENTS))
+        segment_counts = np.zeros(len(SEGMENTS), dtype=np.int64)
+        for user in self.users:
+            user.airdrop_points /= max_points
+            user.step('TGE')
+            total += user.tokens
+            code = size_code(user)
+            if code < len(SEGMENTS):
+                segment_tokens[code] += user.tokens
+                segment_counts[code] += 1
+        return total, segment_tokens, segment_counts
+
+    def step_postTGE(self, current_price=None, baseline_price=None, postTGE_rewards_policy=None, dt=1):
+        """
+        Advance every user by one PostTGE step of `dt` months and return the number of
+        active users.
+        """
+        step_kwargs = {} if dt == 1 else {'dt': dt}
+        num_active = 0
+        for user in self.users:
+            user.step(
+                phase='PostTGE',
+                current_price=current_price,
+                baseline_price=baseline_price,
+                postTGE_rewards_policy=postTGE_rewards_policy,
+                **step_kwargs
+            )
+            num_active += bool(user.active)
+        return num_active
+
+    def effective_weights(self, beta=1.0):
+        """
+        Return (total_eff, active_eff), the sums over all users and over active users of
+        effective_weight = tokens * (1 + 0.1 * active_days) + beta * endowment.
+        """
+        total_eff = 0.0
+        active_eff = 0.0
+        for user in self.users:
+            eff = user.tokens * (1 + 0.1 * user.active_days) + beta * user.endowment
+            total_eff += eff
+            if user.active:
+                active_eff += eff
+        return total_eff, active_eff
+
     def get_active_users(self):
         return [user for user in self.users if user.active]
+
+
+_RETENTION_BASE_BY_CODE = np.array([RETENTION_BASE.get(segment, DEFAULT_RETENTION_BASE)
+                                    for segment in SEGMENTS])
+
+# Post-TGE steps between full recomputations of the incremental effective-weight sums.
+EFFECTIVE_WEIGHTS_RECOMPUTE_INTERVAL = 12
+
+def _bernoulli_indices(n, p, rng):
+    """
+    Sorted indices of the successes among n Bernoulli(p) trials. They are drawn as
+    geometric gaps, so the cost is proportional to the number of successes, not n.
+    """
+    indices = []
+    last = -1
+    while True:
+        remaining = n - last - 1
+        batch = int(remaining * p + 4 * np.sqrt(remaining * p) + 16)
+        positions = last + np.cumsum(rng.geometric(p, batch))
+        if positions[-1] >= n:
+            indices.append(positions[positions < n])
+            return np.concatenate(indices)
+        indices.append(positions)
+        last = positions[-1]
+
+class Cohorts:
+    """
+    Groups of users with identical pre-TGE state.
+
+    Attributes are arrays with one entry per cohort (user_size, interaction_rate,
+    endowment, decay_rate, airdrop_points), plus:
+      - counts: number of users in each cohort,
+      - inverse: cohort index of each user in the pool,
+      - first: pool index of one representative user per cohort.
+    """
+    KEY_COLUMNS = ('user_size', 'interaction_rate', 'endowment', 'decay_rate', 'airdrop_points')
+    # Largest mixed-radix key space counted with np.bincount (multiple of num_users).
+    MAX_KEY_SPACE_FACTOR = 4
+
+    def __init__(self, pool):
+        num_users = pool.num_users
+        key, radix = self._direct_key([getattr(pool, name) for name in self.KEY_COLUMNS],
+                                      self.MAX_KEY_SPACE_FACTOR * num_users + 1024)
+        if key is not None:
+            # Generated populations have small integer codes (segment codes, Poisson draws
+            # and constants), so the key space is small and cohorts are found in O(N)
+            # without sorting.
+            counts = np.bincount(key, minlength=radix)
+            present = counts > 0
+            cohort_of_key = np.cumsum(present) - 1
+            self.inverse = cohort_of_key[key]
+            self.counts = counts[present]
+            self.first = np.full(len(self.counts), num_users, dtype=np.int64)
+            np.minimum.at(self.first, self.inverse, np.arange(num_users))
+        else:
+            # Arbitrary values: factorize each column, then combine the codes into one key.
+            key = np.zeros(num_users, dtype=np.int64)
+            radix = 1
+            for name in self.KEY_COLUMNS:
+                values, codes = np.unique(getattr(pool, name), return_inverse=True)
+                if radix * len(values) >= 2 ** 62:
+                    unique_keys, key = np.unique(key, return_inverse=True)
+                    radix = len(unique_keys)
+                key = key * len(values) + codes
+                radix *= len(values)
+            _, self.first, self.inverse, self.counts = np.unique(key, return_index=True,
+                                                                 return_inverse=True, return_counts=True)
+        for name in self.KEY_COLUMNS:
+            setattr(self, name, getattr(pool, name)[self.first])
+        self.tokens = np.zeros(len(self.first))
+
+    def __len__(self):
+        return len(self.first)
+
+    @staticmethod
+    def _small_int_codes(column):
+        # (codes, radix) if the values map exactly to a small integer range (directly or
+        # in tenths, like the +0.1 endowment baseline), else None. O(N), no sorting.
+        if column.dtype.kind in 'iub':
+            low = int(column.min())
+            return column.astype(np.int64) - low, int(column.max()) - low + 1
+        low, high = column.min(), column.max()
+        if low == high:
+            return np.zeros(len(column), dtype=np.int64), 1
+        for scale in (1, 10):
+            scaled = np.rint(column * scale)
+            if np.all(scaled / scale == column):
+                low = scaled.min()
+                return (scaled - low).astype(np.int64), int(scaled.max() - low) + 1
+        return None
+
+    @classmethod
+    def _direct_key(cls, columns, max_radix):
+        # Mixed-radix integer key over the column codes, or (None, None) if a column is
+        # not small-integer coded or the key space exceeds max_radix.
+        key = None
+        radix = 1
+        for column in columns:
+            coded = cls._small_int_codes(np.asarray(column))
+            if coded is None or radix * coded[1] > max_radix:
+                return None, None
+            codes, size = coded
+            key = codes if key is None else key * size + codes
+            radix *= size
+        return key, radix
+
+class ColumnChunk:
+    """
+    Users [start, stop) of a ColumnarUserPool, with one attribute per column holding
+    that range of the column. In-place writes to the arrays update the pool.
+    """
+    def __init__(self, start, stop, columns):
+        self.start = start
+        self.stop = stop
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.stop - self.start
+
+class UserViews(Sequence):
+    """
+    Read-only sequence of per-user views over a ColumnarUserPool, or over the
+    users start..stop of it. Views are created on access, so iterating does not
+    keep them alive.
+    """
+    def __init__(self, pool, start=0, stop=None):
+        self._pool = pool
+        self._start = start
+        self._stop = stop if stop is not None else pool.num_users
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("user index out of range")
+        index += self._start
+        view_cls = SybilUserView if self._pool.is_sybil[index] else RegularUserView
+        return view_cls(self._pool, index)
+
+class ColumnarUserPool(UserPool):
+    """
+    Struct-of-arrays UserPool.
+
+    Instead of one RegularUser/SybilUser object per user, every attribute is
+    stored as a NumPy column indexed by position in the pool:
+      - wealth, interaction_rate, endowment, decay_rate, airdrop_points, tokens: float64
+      - user_size: int8 code into users.SEGMENTS (sybils use users.SYBIL)
+      - active: bool, is_sybil: bool, user_id: int64
+      - active_days: float64 (months; fractional with sub-monthly post-TGE steps)
+
+    `users` is a sequence of RegularUserView/SybilUserView objects, so code written
+    against UserPool (e.g. test_user_simulation.py) keeps working.
+
+    `population` is an optional mapping with the base_population columns to use instead
+    of drawing them from the population stream, e.g. a shared_population.SharedPopulation
+    attached in many worker processes. Its arrays are used as-is (read-only ones stay
+    read-only and are shared by copy()); only the MUTABLE_COLUMNS are allocated per pool.
+    """
+    COLUMNS = ('user_id', 'wealth', 'user_size', 'interaction_rate', 'endowment', 'decay_rate',
+               'airdrop_points', 'tokens', 'active', 'active_days', 'is_sybil')
+    # Columns a run writes to; the others are fixed once the population is drawn.
+    MUTABLE_COLUMNS = ('airdrop_points', 'tokens', 'active', 'active_days')
+
+    def generate_users(self):
+        if self._population is not None:
+            population = self._population
+            if len(population['user_id']) != self.num_users:
+                raise ValueError(f"population has {len(population['user_id'])} users, expected {self.num_users}.")
+        else:
+            population = base_population(self.num_users, self.sybil_fraction, self.size_mix, self.streams.population)
+        for name in self.COLUMNS:
+            if name not in self.MUTABLE_COLUMNS:
+                setattr(self, name, population[name])
+        self.airdrop_points = np.zeros(self.num_users)
+        self.tokens = np.zeros(self.num_users)
+        self.active = np.ones(self.num_users, dtype=bool)
+        self.active_days = np.zeros(self.num_users)
+        self.users = UserViews(self)
+
+    def __init__(self, *args, population=None, **kwargs):
+        self._eff_aggregates = None
+        self._sybils_retired = False
+        self._regular_cache = {}
+        self._population = population
+        super().__init__(*args, **kwargs)
+
+    def copy(self):
+        """
+        Independent copy of the pool and its random streams. Read-only columns (those of
+        a shared population) are shared with the copy instead of copied.
+        """
+        memo = {id(self._population): self._population}
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            if not column.flags.writeable:
+                memo[id(column)] = column
+        return copy.deepcopy(self, memo)
+
+    def set_airdrop_policy(self, airdrop_policy):
+        # User views read the policy from the pool.
+        self.airdrop_policy = airdrop_policy
+
+    def _chunks(self):
+        """
+        Yield ColumnChunks covering the pool in order. Every pool-wide operation streams
+        over these, so subclasses only need to change how chunks are materialized.
+        """
+        yield ColumnChunk(0, self.num_users, {name: getattr(self, name) for name in self.COLUMNS})
+
+    def step_all(self, phase):
+        if phase == 'PreTGE':
+            self.accrue_preTGE(1)
+        elif phase == 'TGE':
+            self.invalidate_effective_weights()
+            for chunk in self._chunks():
+                chunk.tokens[:] = self.airdrop_policy.calculate_tokens_batch(
+                    chunk.airdrop_points, UserViews(self, chunk.start, chunk.stop))
+        else:
+            super().step_all(phase)
+
+    def accrue_preTGE(self, n_steps):
+        for chunk in self._chunks():
+            chunk.airdrop_points[:] = accrue_airdrop_points(chunk.airdrop_points, chunk.interaction_rate,
+                                                            chunk.endowment, chunk.decay_rate, n_steps)
+
+    def step_postTGE(self, current_price=None, baseline_price=None, postTGE_rewards_policy=None, dt=1):
+        """
+        Batched RegularUser/SybilUser PostTGE step for the whole pool: retention
+        probabilities, Bernoulli draws, active_days and rewards in a few array operations.
+        Sybils exit in bulk at the first step and are skipped afterwards.
+
+        With dt < 1 only the users that redraw their activity (found with
+        _bernoulli_indices) get retention probabilities and draws. The effective-weight
+        aggregates are updated from the users whose tokens or active_days change,
+        i.e. the active ones (see effective_weights).
+        """
+        if current_price is not None and baseline_price is not None:
+            price_ratio = current_price / baseline_price
+            if price_ratio >= 1:
+                confidence_factor = 1.0 + 0.5 * (price_ratio - 1.0)
+            else:
+                confidence_factor = 1.0 - 0.5 * (1.0 - price_ratio)
+        else:
+            confidence_factor = 1.0
+
+        aggregates = self._eff_aggregates
+        total_delta = 0.0
+        active_eff = 0.0
+        num_active = 0
+        reward_kwargs = {} if dt == 1 else {'dt': dt}
+        for chunk in self._chunks():
+            regular = self._regular_index(chunk)
+            if not self._sybils_retired:
+                chunk.active[chunk.is_sybil] = False
+            if dt < 1:
+                redrawn = regular[_bernoulli_indices(len(regular), dt, self.streams.retention)]
+            else:
+                redrawn = regular
+            draws = self.streams.retention.random(len(redrawn))
+            size_base = _RETENTION_BASE_BY_CODE[chunk.user_size[redrawn]]
+
+            if postTGE_rewards_policy is not None:
+                user_future_multiplier = postTGE_rewards_policy.engagement_policy.calculate_multiplier(
+                    chunk.active_days[redrawn] + dt
+                )
+                reward_incentive_factor = 1.0 + 0.2 * (user_future_multiplier - 1.0)
+            else:
+                reward_incentive_factor = 1.0
+
+            prob_stay = np.clip(size_base * confidence_factor * reward_incentive_factor, 0.0, 1.0)
+            chunk.active[redrawn] = draws < prob_stay
+
+            staying = np.flatnonzero(chunk.active)
+            old_tokens = chunk.tokens[staying]
+            old_days = chunk.active_days[staying]
+            active_days = old_days + dt
+            chunk.active_days[staying] = active_days
+            if postTGE_rewards_policy is not None:
+                if hasattr(postTGE_rewards_policy, 'apply_rewards_batch'):
+                    chunk.tokens[staying] = postTGE_rewards_policy.apply_rewards_batch(
+                        old_tokens, active_days, **reward_kwargs)
+                else:
+                    for i in staying:
+                        postTGE_rewards_policy.apply_rewards(self.users[chunk.start + i], chunk.active_days[i],
+                                                             **reward_kwargs)
+            if aggregates is not None:
+                endowment = aggregates['beta'] * chunk.endowment[staying]
+                eff = chunk.tokens[staying] * (1 + 0.1 * active_days) + endowment
+                total_delta += eff.sum() - (old_tokens * (1 + 0.1 * old_days) + endowment).sum()
+                active_eff += eff.sum()
+            num_active += len(staying)
+        self._sybils_retired = True
+        if aggregates is not None:
+            aggregates['total'] += total_delta
+            aggregates['active'] = active_eff
+            aggregates['steps'] += 1
+        return num_active
+
+    def _regular_index(self, chunk):
+        """
+        Positions of the non-sybil users within `chunk`, cached per chunk.
+        """
+        if chunk.start not in self._regular_cache:
+            self._regular_cache[chunk.start] = np.flatnonzero(~chunk.is_sybil)
+        return self._regular_cache[chunk.start]
+
+    def effective_weights(self, beta=1.0):
+        """
+        (total_eff, active_eff) as in UserPool.effective_weights.
+
+        After a full scan the sums are kept up to date incrementally by step_postTGE,
+        which only visits the users that changed. They are recomputed from scratch
+        every EFFECTIVE_WEIGHTS_RECOMPUTE_INTERVAL post-TGE steps to bound rounding
+        drift, when beta changes, and after operations that rewrite tokens. Call
+        invalidate_effective_weights() after writing pool columns directly.
+        """
+        aggregates = self._eff_aggregates
+        if (aggregates is not None and aggregates['beta'] == beta
+                and aggregates['steps'] < EFFECTIVE_WEIGHTS_RECOMPUTE_INTERVAL):
+            return aggregates['total'], aggregates['active']
+        total_eff = 0.0
+        active_eff = 0.0
+        for chunk in self._chunks():
+            eff = chunk.tokens * (1 + 0.1 * chunk.active_days) + beta * chunk.endowment
+            total_eff += eff.sum()
+            active_eff += eff[chunk.active].sum()
+        self._eff_aggregates = {'beta': beta, 'total': total_eff, 'active': active_eff, 'steps': 0}
+        return total_eff, active_eff
+
+    def invalidate_effective_weights(self):
+        self._eff_aggregates = None
+
+    def add_preTGE_rewards(self, preTGE_rewards_policy):
+        for chunk in self._chunks():
+            stats = ActivityStats(chunk.user_size, chunk.endowment, seed=draw_seed(self.streams.stats))
+            chunk.airdrop_points += preTGE_rewards_policy.calculate_points_batch(
+                stats, UserViews(self, chunk.start, chunk.stop))
+
+    def max_airdrop_points(self):
+        return max((chunk.airdrop_points.max() for chunk in self._chunks() if len(chunk)), default=0.0)
+
+    def normalize_airdrop_points(self, max_points):
+        for chunk in self._chunks():
+            chunk.airdrop_points /= max_points
+
+    def total_tokens(self):
+        return sum(chunk.tokens.sum() for chunk in self._chunks())
+
+    def scale_tokens(self, factor):
+        self.invalidate_effective_weights()
+        for chunk in self._chunks():
+            chunk.tokens *= factor
+
+    def segment_tokens(self):
+        totals = np.zeros(len(SEGMENTS))
+        for chunk in self._chunks():
+            totals += np.bincount(chunk.user_size, weights=chunk.tokens, minlength=len(SEGMENTS))
+        return {segment: totals[code] for code, segment in enumerate(SEGMENTS)}
+
+    def convert_tokens(self, max_points=1):
+        self.invalidate_effective_weights()
+        segment_tokens = np.zeros(len(SEGMENTS))
+        segment_counts = np.zeros(len(SEGMENTS), dtype=np.int64)
+        for chunk in self._chunks():
+            chunk.airdrop_points /= max_points
+            chunk.tokens[:] = self.airdrop_policy.calculate_tokens_batch(
+                chunk.airdrop_points, UserViews(self, chunk.start, chunk.stop))
+            segment_tokens += np.bincount(chunk.user_size, weights=chunk.tokens, minlength=len(SEGMENTS))
+            segment_counts += np.bincount(chunk.user_size, minlength=len(SEGMENTS))
+        return segment_tokens.sum(), segment_tokens, segment_counts
+
+    def checkpoint_arrays(self):
+        """
+        Pool columns by name, for checkpoint.write_checkpoint (memory maps for chunked pools).
+        """
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def checkpoint_state(self):
+        return {'sybils_retired': self._sybils_retired, 'eff_aggregates': self._eff_aggregates}
+
+    def restore_checkpoint(self, arrays, state):
+        """
+        Restore the columns and incremental state saved by checkpoint_arrays and
+        checkpoint_state; `arrays` maps each column name to its saved values. Columns
+        are copied chunk by chunk, so memory-mapped values (see checkpoint.read_checkpoint)
+        are never loaded whole.
+        """
+        for name in self.COLUMNS:
+            if not getattr(self, name).flags.writeable:
+                # Shared read-only base columns; the population is the one that was saved.
+                continue
+            values = arrays[name]
+            for chunk in self._chunks():
+                getattr(chunk, name)[:] = values[chunk.start:chunk.stop]
+        self._sybils_retired = state['sybils_retired']
+        self._eff_aggregates = state['eff_aggregates']
+        self._regular_cache = {}
+
+    def replicate(self, replicates, rng=None):
+        """
+        ReplicatedPostTGEState with `replicates` independent copies of the post-TGE state.
+        """
+        return ReplicatedPostTGEState(self, replicates, rng)
+
+    def cohorts(self):
+        """
+        Compress the pool into Cohorts of users sharing user_size, interaction_rate,
+        endowment, decay_rate and airdrop_points.
+        """
+        return Cohorts(self)
+
+    def get_active_users(self):
+        return [self.users[i] for i in np.flatnonzero(self.active)]
+
+class ReplicatedPostTGEState:
+    """
+    Post-TGE state of R independent replicates of a ColumnarUserPool population.
+
+    All replicates share the population and its TGE tokens. tokens, active and
+    active_days are replicates x users arrays, so each post-TGE step advances every
+    replicate with the same few array operations that ColumnarUserPool.step_postTGE
+    uses for one. Only regular users are stored: sybils exit at the first step and
+    their constant effective weight is added to the totals.
+
+    It exposes effective_weights and step_postTGE like a pool, returning one value per
+    replicate. Memory is about 17 * R bytes per regular user, plus temporaries.
+    The post-TGE rewards policy must provide apply_rewards_batch. Draws come from `rng`,
+    by default the pool's retention stream.
+    """
+    def __init__(self, pool, replicates, rng=None):
+        self.replicates = replicates
+        self.rng = as_generator(rng) if rng is not None else pool.streams.retention
+        self.num_users = pool.num_users
+        regular = np.flatnonzero(~pool.is_sybil)
+        self.size_base = _RETENTION_BASE_BY_CODE[pool.user_size[regular]]
+        self.endowment = pool.endowment[regular]
+        self.tokens = np.tile(pool.tokens[regular], (replicates, 1))
+        self.active = np.tile(pool.active[regular], (replicates, 1))
+        self.active_days = np.tile(pool.active_days[regular].astype(float), (replicates, 1))
+        sybil = pool.is_sybil
+        self._sybil_tokens = pool.tokens[sybil] * (1 + 0.1 * pool.active_days[sybil])
+        self._sybil_endowment = pool.endowment[sybil]
+        self._sybil_active = pool.active[sybil].copy()
+
+    CHECKPOINT_ARRAYS = ('tokens', 'active', 'active_days', '_sybil_active')
+
+    def checkpoint_arrays(self):
+        return {name: getattr(self, name) for name in self.CHECKPOINT_ARRAYS}
+
+    def restore_checkpoint(self, arrays):
+        for name in self.CHECKPOINT_ARRAYS:
+            setattr(self, name, np.array(arrays[name]))
+
+    def effective_weights(self, beta=1.0):
+        """
+        Arrays (total_eff, active_eff) with one entry per replicate.
+        """
+        eff = self.tokens * (1 + 0.1 * self.active_days) + beta * self.endowment
+        sybil_eff = self._sybil_tokens + beta * self._sybil_endowment
+        total_eff = eff.sum(axis=1) + sybil_eff.sum()
+        active_eff = np.einsum('ij,ij->i', eff, self.active) + sybil_eff[self._sybil_active].sum()
+        return total_eff, active_eff
+
+    def step_postTGE(self, current_price=None, baseline_price=None, postTGE_rewards_policy=None, dt=1):
+        """
+        One post-TGE step for every replicate; current_price has one entry per replicate.
+        Returns the number of active users of each replicate.
+        """
+        if current_price is not None and baseline_price is not None:
+            price_ratio = np.asarray(current_price) / baseline_price
+            confidence_factor = np.where(price_ratio >= 1, 1.0 + 0.5 * (price_ratio - 1.0),
+                                         1.0 - 0.5 * (1.0 - price_ratio))[:, None]
+        else:
+            confidence_factor = 1.0
+
+        if postTGE_rewards_policy is not None:
+            user_future_multiplier = postTGE_rewards_policy.engagement_policy.calculate_multiplier(
+                self.active_days + dt
+            )
+            reward_incentive_factor = 1.0 + 0.2 * (user_future_multiplier - 1.0)
+        else:
+            reward_incentive_factor = 1.0
+
+        prob_stay = np.clip(self.size_base * confidence_factor * reward_incentive_factor, 0.0, 1.0)
+        draws = self.rng.random(self.active.shape)
+        if dt < 1:
+            # A draw below dt redraws the activity; draw / dt is uniform for those users.
+            redrawn = draws < dt
+            self.active = np.where(redrawn, draws / dt < prob_stay, self.active)
+        else:
+            self.active = draws < prob_stay
+        self._sybil_active[:] = False
+
+        # Dense updates: masked ufuncs (where=) are much slower than a multiply or select here.
+        self.active_days += dt * self.active
+        if postTGE_rewards_policy is not None:
+            reward_kwargs = {} if dt == 1 else {'dt': dt}
+            rewarded = postTGE_rewards_policy.apply_rewards_batch(self.tokens, self.active_days, **reward_kwargs)
+            self.tokens = np.where(self.active, rewarded, self.tokens)
+        return self.active.sum(axis=1)
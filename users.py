@@ -1,6 +1,92 @@
 import numpy as np
 from abc import ABC, abstractmethod
 from airdrop_policy import AirdropPolicy
+from random_streams import as_generator
+
+# Integer codes used by the columnar pool: regular users store their size code,
+# sybils are stored under the extra 'sybil' segment.
+USER_SIZES = ('small', 'medium', 'large')
+SEGMENTS = USER_SIZES + ('sybil',)
+SYBIL = SEGMENTS.index('sybil')
+
+# Poisson rate of interaction_rate and endowment draws, by segment.
+POISSON_LAM = {'small': 1, 'medium': 3, 'large': 5, 'sybil': 0.5}
+
+# Base monthly probability of staying active post-TGE, by user size.
+RETENTION_BASE = {'small': 0.4, 'medium': 0.7, 'large': 0.9}
+DEFAULT_RETENTION_BASE = 0.5
+
+def _unclamped_points(points, a, b, n_steps):
+    """
+    n-fold application of p -> a * p + b without the zero clamp:
+    a^n * p + b * (1 - a^n) / (1 - a), with the sum read as n when a == 1.
+    """
+    a_n = np.power(a, n_steps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        geometric_sum = np.where(a == 1.0, n_steps, (1.0 - a_n) / (1.0 - a))
+    return a_n * points + b * geometric_sum
+
+def accrue_airdrop_points(airdrop_points, interaction_rate, endowment, decay_rate, n_steps, dt=1):
+    """
+    Closed form of `n_steps` calls to User.update_airdrop_points, for arrays of users.
+
+    Each step is the affine map p -> max(0, a * p + b) with
+      a = 1 - (interaction_rate + decay_rate) * dt,   b = interaction_rate * endowment * dt.
+    For non-negative rates and endowments (b >= 0), and p >= 0:
+      - a >= -1: only the first step can hit the zero clamp, so one explicit step
+        followed by the geometric closed form is exact.
+      - a < -1: the unclamped sequence oscillates with growing amplitude around
+        p* = b / (1 - a). It is exact until its first negative value at step n_clamp,
+        after which the clamped sequence cycles 0, b, 0, b, ...
+    Rows with b < 0 fall back to a vectorized per-step recurrence.
+    """
+    points, r, e, d = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in
+                                            (airdrop_points, interaction_rate, endowment, decay_rate)))
+    points = points.copy()
+    if n_steps <= 0:
+        return points
+    # Work on 1-d arrays so the masked assignments below also accept scalars.
+    shape = points.shape
+    points, r, e, d = (np.atleast_1d(x) for x in (points, r, e, d))
+    a = 1.0 - (r + d) * dt
+    b = r * e * dt
+
+    first = np.maximum(a * points + b, 0.0)
+    remaining = n_steps - 1
+    result = _unclamped_points(first, a, b, remaining)
+
+    diverging = (a < -1.0) & (b >= 0)
+    if diverging.any():
+        a_div, b_div, p_div = a[diverging], b[diverging], first[diverging]
+        p_star = b_div / (1.0 - a_div)
+        dev = p_div - p_star
+        abs_a = -a_div
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_clamp = np.floor(np.log(p_star / np.abs(dev)) / np.log(abs_a)) + 1
+        n_clamp = np.where(np.isfinite(n_clamp), np.maximum(n_clamp, 1), np.inf)
+        # The deviation must be negative at n_clamp: odd n for dev > 0, even n for dev < 0.
+        odd = np.mod(np.where(np.isfinite(n_clamp), n_clamp, 0), 2) == 1
+        n_clamp = np.where(np.isfinite(n_clamp) & (odd != (dev > 0)), n_clamp + 1, n_clamp)
+        # Correct for rounding in the logarithms by checking against the unclamped values.
+        finite = np.isfinite(n_clamp)
+        n_safe = np.where(finite, n_clamp, 1)
+        n_clamp = np.where(finite & (p_star + np.power(a_div, n_safe) * dev >= 0), n_clamp + 2, n_clamp)
+        n_prev = np.where(finite, np.maximum(n_clamp - 2, 1), 1)
+        n_clamp = np.where(finite & (n_clamp - 2 >= 1) & (p_star + np.power(a_div, n_prev) * dev < 0),
+                           n_clamp - 2, n_clamp)
+        # Starting from zero the clamped map alternates b, 0, b, 0, ...
+        n_clamp = np.where(p_div == 0, 0, n_clamp)
+        steps_after_clamp = remaining - n_clamp
+        cycled = np.where(np.mod(steps_after_clamp, 2) == 1, b_div, 0.0)
+        result[diverging] = np.where(n_clamp <= remaining, cycled, result[diverging])
+
+    negative_b = b < 0
+    if negative_b.any():
+        p = points[negative_b]
+        for _ in range(n_steps):
+            p = np.maximum(a[negative_b] * p + b[negative_b], 0.0)
+        result[negative_b] = p
+    return result.reshape(shape)
 
 class User(ABC):
     """
@@ -33,34 +119,41 @@ class User(ABC):
         pass
 
 class RegularUser(User):
-    def __init__(self, wealth, user_id, user_size, airdrop_policy=None):
+    def __init__(self, wealth, user_id, user_size, airdrop_policy=None, interaction_rate=None, endowment=None,
+                 rng=None):
+        """
+        interaction_rate and endowment are drawn from the size's Poisson rate unless
+        given (e.g. by user_pool.generate_population); a given endowment is used as-is.
+        `rng` is the numpy Generator (or seed) used for these draws and for the PostTGE
+        activity draws; pools share theirs with all of their users.
+        """
         super().__init__(wealth, user_id, airdrop_policy)
         self.user_size = user_size
         self.decay_rate = 0.1
         self.active_days = 0
+        self.rng = as_generator(rng)
+
+        lam = POISSON_LAM.get(user_size)
+        if interaction_rate is None:
+            interaction_rate = self.rng.poisson(lam=lam) if lam is not None else 1
+        if endowment is None:
+            endowment = self.rng.poisson(lam=lam) if lam is not None else 1
+            endowment += 0.1  # initial baseline endowment
+        self.interaction_rate = interaction_rate
+        self.endowment = endowment
 
-        if user_size == 'small':
-            self.interaction_rate = np.random.poisson(lam=1)
-            self.endowment = np.random.poisson(lam=1)
-        elif user_size == 'medium':
-            self.interaction_rate = np.random.poisson(lam=3)
-            self.endowment = np.random.poisson(lam=3)
-        elif user_size == 'large':
-            self.interaction_rate = np.random.poisson(lam=5)
-            self.endowment = np.random.poisson(lam=5)
-        else:
-            self.interaction_rate = 1
-            self.endowment = 1
-        
-        self.endowment += 0.1  # initial baseline endowment
-
-    def step(self, phase, current_price=None, baseline_price=None, postTGE_rewards_policy=None):
+    def step(self, phase, current_price=None, baseline_price=None, postTGE_rewards_policy=None, dt=1):
+        """
+        `dt` is the PostTGE step length in months. With dt < 1 the user's activity is
+        redrawn with probability dt per step (so once a month on average), active_days
+        grows by dt and rewards compound as multiplier ** dt.
+        """
         if phase == 'PreTGE':
             self.update_airdrop_points(dt=1)
         elif phase == 'TGE':
             self.tokens = self.airdrop_policy.calculate_tokens(self.airdrop_points, self)
         elif phase == 'PostTGE':
-            size_base = {'small': 0.4, 'medium': 0.7, 'large': 0.9}.get(self.user_size, 0.5)
+            size_base = RETENTION_BASE.get(self.user_size, DEFAULT_RETENTION_BASE)
 
             if current_price is not None and baseline_price is not None:
                 price_ratio = current_price / baseline_price
@@ -73,7 +166,7 @@ class RegularUser(User):
 
             if postTGE_rewards_policy is not None:
                 user_future_multiplier = postTGE_rewards_policy.engagement_policy.calculate_multiplier(
-                    self.active_days + 1
+                    self.active_days + dt
                 )
                 reward_incentive_factor = 1.0 + 0.2 * (user_future_multiplier - 1.0)
             else:
@@ -81,21 +174,27 @@ class RegularUser(User):
 
             prob_stay = size_base * confidence_factor * reward_incentive_factor
             prob_stay = max(0.0, min(1.0, prob_stay))
-            self.active = (np.random.rand() < prob_stay)
+            if dt >= 1 or self.rng.random() < dt:
+                self.active = (self.rng.random() < prob_stay)
 
             if self.active:
-                self.active_days += 1
+                self.active_days += dt
                 if postTGE_rewards_policy is not None:
-                    postTGE_rewards_policy.apply_rewards(self, self.active_days)
+                    if dt == 1:
+                        postTGE_rewards_policy.apply_rewards(self, self.active_days)
+                    else:
+                        postTGE_rewards_policy.apply_rewards(self, self.active_days, dt=dt)
 
 class SybilUser(User):
     """
     Represents a sybil user with lower interaction and immediate exit post-TGE.
     """
-    def __init__(self, wealth, user_id, airdrop_policy=None):
+    def __init__(self, wealth, user_id, airdrop_policy=None, interaction_rate=None, endowment=None, rng=None):
         super().__init__(wealth, user_id, airdrop_policy)
-        self.interaction_rate = np.random.poisson(lam=0.5)
-        self.endowment = np.random.poisson(lam=0.5)
+        lam = POISSON_LAM['sybil']
+        self.rng = rng = as_generator(rng)
+        self.interaction_rate = interaction_rate if interaction_rate is not None else rng.poisson(lam=lam)
+        self.endowment = endowment if endowment is not None else rng.poisson(lam=lam)
         self.decay_rate = 0.1 # Consider changing this for SybilUsers
         self.active_days = 0
 
@@ -107,3 +206,73 @@ class SybilUser(User):
         elif phase == 'PostTGE':
             # Sybils exit immediately
             self.active = False
+
+
+def _column_property(name):
+    """
+    Property reading/writing element `self._index` of the pool column `name`.
+    """
+    def fget(self):
+        return getattr(self._pool, name)[self._index]
+
+    def fset(self, value):
+        getattr(self._pool, name)[self._index] = value
+
+    return property(fget, fset)
+
+def has_stock_preTGE_step(user):
+    """
+    True if `user` accrues PreTGE points with the stock recurrence, i.e. neither
+    `step` nor `update_airdrop_points` is overridden, so accrue_airdrop_points applies.
+    """
+    cls = type(user)
+    return (cls.step in (RegularUser.step, SybilUser.step)
+            and cls.update_airdrop_points is User.update_airdrop_points)
+
+class _UserViewMixin:
+    """
+    Lightweight per-user view over a ColumnarUserPool row.
+
+    Views hold no state of their own: every attribute read or write goes to the
+    pool's arrays, so the regular `step` logic keeps working unchanged.
+    """
+    __slots__ = ()
+
+    def __init__(self, pool, index):
+        self._pool = pool
+        self._index = index
+
+    user_id = _column_property('user_id')
+    wealth = _column_property('wealth')
+    interaction_rate = _column_property('interaction_rate')
+    endowment = _column_property('endowment')
+    decay_rate = _column_property('decay_rate')
+    airdrop_points = _column_property('airdrop_points')
+    tokens = _column_property('tokens')
+    active = _column_property('active')
+    active_days = _column_property('active_days')
+
+    @property
+    def airdrop_policy(self):
+        return self._pool.airdrop_policy
+
+    @property
+    def rng(self):
+        return self._pool.streams.retention
+
+    def __repr__(self):
+        return f"{type(self).__name__}(user_id={self.user_id}, index={self._index})"
+
+class RegularUserView(_UserViewMixin, RegularUser):
+    __slots__ = ('_pool', '_index')
+
+    @property
+    def user_size(self):
+        return USER_SIZES[self._pool.user_size[self._index]]
+
+    @user_size.setter
+    def user_size(self, value):
+        self._pool.user_size[self._index] = USER_SIZES.index(value)
+
+class SybilUserView(_UserViewMixin, SybilUser):
+    __slots__ = ('_pool', '_index')
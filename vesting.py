@@ -1,3 +1,4 @@
+from functools import lru_cache
 import numpy as np
 
 class VestingSchedule:
@@ -26,25 +27,31 @@ class VestingSchedule:
         self.initial_cliff_delay = initial_cliff_delay
 
     def get_unlocked_fraction(self, months_elapsed):
-        if months_elapsed < 0:
-            return 0.0
-
-        if self.lockup_duration > 0:
-            if months_elapsed < self.lockup_duration:
-                return self.unlock_at_tge
-            elif months_elapsed < self.lockup_duration + self.unlock_duration:
-                linear_progress = (months_elapsed - self.lockup_duration) / self.unlock_duration
-                return self.unlock_at_tge + self.initial_cliff_unlock + (1 - self.unlock_at_tge - self.initial_cliff_unlock) * linear_progress
-            else:
-                return 1.0
+        """
+        Unlocked fraction after `months_elapsed` months. Accepts a scalar or an array
+        of months (returning an array of fractions).
+        """
+        months = np.asarray(months_elapsed, dtype=float)
+        # Linear unlocking starts after the lockup, or after the cliff delay if there is no lockup.
+        start = self.lockup_duration if self.lockup_duration > 0 else self.initial_cliff_delay
+        if self.unlock_duration > 0:
+            linear_progress = (months - start) / self.unlock_duration
         else:
-            if months_elapsed < self.initial_cliff_delay:
-                return self.unlock_at_tge
-            elif months_elapsed < self.initial_cliff_delay + self.unlock_duration:
-                linear_progress = (months_elapsed - self.initial_cliff_delay) / self.unlock_duration
-                return self.unlock_at_tge + self.initial_cliff_unlock + (1 - self.unlock_at_tge - self.initial_cliff_unlock) * linear_progress
-            else:
-                return 1.0
+            linear_progress = np.zeros_like(months)
+        fraction = np.select(
+            [months < 0, months < start, months < start + self.unlock_duration],
+            [0.0, self.unlock_at_tge,
+             self.unlock_at_tge + self.initial_cliff_unlock + (1 - self.unlock_at_tge - self.initial_cliff_unlock) * linear_progress],
+            default=1.0
+        )
+        return float(fraction) if fraction.ndim == 0 else fraction
+
+    def key(self):
+        """
+        Tuple of the schedule parameters; schedules with equal keys unlock identically.
+        """
+        return (self.allocation, self.unlock_at_tge, self.lockup_duration, self.initial_cliff_unlock,
+                self.unlock_duration, self.initial_cliff_delay)
 
     def get_unlocked_tokens(self, months_elapsed):
         fraction = self.get_unlocked_fraction(months_elapsed)
@@ -129,12 +136,183 @@ class PostTGERewardsManager:
             )
         }
 
+    @property
+    def groups(self):
+        return list(self.schedules)
+
     def get_unlocked_allocations(self, months_elapsed):
         unlocked = {}
         for group, schedule in self.schedules.items():
             unlocked[group] = schedule.get_unlocked_tokens(months_elapsed)
         return unlocked
 
+    def unlocked_by_group(self, months):
+        """
+        Unlocked tokens per group (rows, in `schedules` order) at each of `months`
+        (columns), which may be fractional.
+        """
+        months = np.asarray(months, dtype=float)
+        return np.array([schedule.get_unlocked_tokens(months) for schedule in self.schedules.values()]).reshape(-1, len(months))
+
+    def unlock_matrix(self, num_months):
+        """
+        Unlocked tokens per group (rows, in `schedules` order) at months 0..num_months-1
+        (columns). The read-only matrix is cached by schedule parameters, so managers with
+        identical vesting (e.g. across a parameter sweep) share it.
+        """
+        return _unlock_matrix(tuple(schedule.key() for schedule in self.schedules.values()), num_months)
+
+@lru_cache(maxsize=32)
+def _unlock_matrix(schedule_keys, num_months):
+    months = np.arange(num_months)
+    matrix = np.array([VestingSchedule(*key).get_unlocked_tokens(months) for key in schedule_keys]).reshape(-1, num_months)
+    matrix.setflags(write=False)
+    return matrix
+
+class VestingLedger:
+    """
+    Per-grant vesting ledger for cap tables with many individual grants.
+
+    Each grant has the parameters of a VestingSchedule plus a group label, and all of
+    them are stored as array columns (grant i is row i). A grant's unlocked tokens are
+    piecewise linear in time: a jump at TGE (unlock_at_tge), a jump at the end of the
+    lockup or cliff delay (initial_cliff_unlock, or everything left if unlock_duration
+    is 0), then a linear ramp to the full allocation.
+
+    - unlocked_tokens(t) evaluates every grant at month t in a few array operations.
+    - unlocked_by_group(months) uses breakpoints compiled per group (cumulative jumps
+      and slopes at each distinct breakpoint), located by binary search, so its cost
+      grows with the number of distinct breakpoints rather than grants.
+    - unlock_matrix(num_months) has the PostTGERewardsManager interface, so a ledger can
+      replace the manager in MonteCarloSimulation.
+
+    Grants are added with add_grants; the compiled breakpoints are rebuilt on the
+    next grouped evaluation.
+    """
+    COLUMNS = ('allocation', 'unlock_at_tge', 'lockup_duration', 'initial_cliff_unlock',
+               'unlock_duration', 'initial_cliff_delay')
+
+    def __init__(self):
+        self.groups = []
+        self.group = np.zeros(0, dtype=np.int64)
+        for name in self.COLUMNS:
+            setattr(self, name, np.zeros(0))
+        self._breakpoints = None
+
+    def __len__(self):
+        return len(self.allocation)
+
+    @classmethod
+    def from_manager(cls, manager):
+        """
+        Ledger with one grant per schedule of a PostTGERewardsManager, grouped by name.
+        """
+        ledger = cls()
+        for group, schedule in manager.schedules.items():
+            ledger.add_grants(**dict(zip(cls.COLUMNS, schedule.key())), group=group)
+        return ledger
+
+    def add_grants(self, allocation, unlock_at_tge=0.0, lockup_duration=0, initial_cliff_unlock=0.0,
+                   unlock_duration=0, initial_cliff_delay=0, group='Grants'):
+        """
+        Append grants. `allocation` is a scalar or an array with one entry per grant; the
+        other parameters (same meaning as in VestingSchedule) and `group` are scalars or
+        arrays of the same length. Returns the indices of the new grants.
+        """
+        allocation = np.atleast_1d(np.asarray(allocation, dtype=float))
+        num_grants = len(allocation)
+        params = dict(zip(self.COLUMNS, (allocation, unlock_at_tge, lockup_duration, initial_cliff_unlock,
+                                         unlock_duration, initial_cliff_delay)))
+        for name, values in params.items():
+            values = np.broadcast_to(np.asarray(values, dtype=float), (num_grants,))
+            setattr(self, name, np.concatenate((getattr(self, name), values)))
+
+        names, codes = np.unique(np.broadcast_to(np.asarray(group, dtype=object), (num_grants,)), return_inverse=True)
+        for name in names:
+            if name not in self.groups:
+                self.groups.append(name)
+        name_codes = np.array([self.groups.index(name) for name in names], dtype=np.int64)
+        self.group = np.concatenate((self.group, name_codes[codes.reshape(-1)]))
+        self._breakpoints = None
+        return np.arange(len(self) - num_grants, len(self))
+
+    def _linear_start(self):
+        # Linear unlocking starts after the lockup, or after the cliff delay if there is no lockup.
+        return np.where(self.lockup_duration > 0, self.lockup_duration, self.initial_cliff_delay)
+
+    def unlocked_fraction(self, months_elapsed):
+        """
+        Unlocked fraction of every grant after `months_elapsed` months (a scalar).
+        """
+        start = self._linear_start()
+        linear = self.unlock_duration > 0
+        linear_progress = np.where(linear, (months_elapsed - start) / np.where(linear, self.unlock_duration, 1), 0.0)
+        return np.select(
+            [np.full(len(self), months_elapsed < 0), months_elapsed < start, months_elapsed < start + self.unlock_duration],
+            [0.0, self.unlock_at_tge,
+             self.unlock_at_tge + self.initial_cliff_unlock + (1 - self.unlock_at_tge - self.initial_cliff_unlock) * linear_progress],
+            default=1.0
+        )
+
+    def unlocked_tokens(self, months_elapsed):
+        """
+        Unlocked tokens of every grant after `months_elapsed` months.
+        """
+        return self.allocation * self.unlocked_fraction(months_elapsed)
+
+    def _compile(self):
+        """
+        Per group: sorted breakpoints, the unlocked total right after each of them and
+        the unlock rate until the next one.
+        """
+        start = self._linear_start()
+        linear = self.unlock_duration > 0
+        rate = np.where(linear, (1 - self.unlock_at_tge - self.initial_cliff_unlock) * self.allocation
+                        / np.where(linear, self.unlock_duration, 1), 0.0)
+        cliff_jump = np.where(linear, self.initial_cliff_unlock, 1 - self.unlock_at_tge) * self.allocation
+        times = np.concatenate((np.zeros(len(self)), start, (start + self.unlock_duration)[linear]))
+        groups = np.concatenate((self.group, self.group, self.group[linear]))
+        jumps = np.concatenate((self.unlock_at_tge * self.allocation, cliff_jump, np.zeros(linear.sum())))
+        slopes = np.concatenate((np.zeros(len(self)), rate, -rate[linear]))
+
+        order = np.lexsort((times, groups))
+        times, groups, jumps, slopes = times[order], groups[order], jumps[order], slopes[order]
+        # Merge events of a group that share a breakpoint.
+        first = np.flatnonzero(np.r_[True, (times[1:] != times[:-1]) | (groups[1:] != groups[:-1])])
+        times, groups = times[first], groups[first]
+        jumps, slopes = np.add.reduceat(jumps, first), np.add.reduceat(slopes, first)
+
+        breakpoints = {}
+        bounds = np.searchsorted(groups, np.arange(len(self.groups) + 1))
+        for code in range(len(self.groups)):
+            lo, hi = bounds[code], bounds[code + 1]
+            b = times[lo:hi]
+            rates = np.cumsum(slopes[lo:hi])
+            values = np.cumsum(jumps[lo:hi] + np.r_[0.0, rates[:-1] * np.diff(b)])
+            breakpoints[code] = (b, values, rates)
+        return breakpoints
+
+    def unlocked_by_group(self, months):
+        """
+        Unlocked tokens per group (rows, in `groups` order) at each of `months` (columns).
+        """
+        if self._breakpoints is None:
+            self._breakpoints = self._compile()
+        months = np.asarray(months, dtype=float)
+        result = np.zeros((len(self.groups), len(months)))
+        for code, (b, values, rates) in self._breakpoints.items():
+            k = np.searchsorted(b, months, side='right') - 1
+            valid = k >= 0
+            kk = k[valid]
+            result[code, valid] = values[kk] + rates[kk] * (months[valid] - b[kk])
+        return result
+
+    def unlock_matrix(self, num_months):
+        """
+        Unlocked tokens per group at months 0..num_months-1, as in PostTGERewardsManager.
+        """
+        return self.unlocked_by_group(np.arange(num_months))
+
 # Example usage for vesting simulation:
 if __name__ == '__main__':
     total_supply = 100_000_000  # e.g., 100 million tokens